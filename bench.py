@@ -0,0 +1,309 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import tz
+from monitor import (
+    ROLLUPS, ROLLUP_SQL, create_db, now_ms, samples_between, range_stats, sample_row, take_sample,
+    Sampler, BatchWriter,
+)
+
+
+# Настройки замеров
+BENCH_ROWS = "10k,100k,1M"  # Размеры синтетических таблиц по умолчанию
+GENERATE_CHUNK = 1000000  # Строк, вставляемых одним запросом генератора
+SAMPLER_TICKS = 200
+INSERT_ROWS = 100000
+QUERY_REPEATS = 20
+QUERY_RANGES = {
+    "1h": 60 * 60 * 1000,
+    "1d": 24 * 60 * 60 * 1000,
+}
+REGRESSION_THRESHOLD = 0.2  # Допустимое ухудшение относительно прошлого прогона
+
+# Синтетическая таблица system_data из rows снимков с шагом interval мс,
+# заканчивающаяся в end. Строки порождает рекурсивный CTE внутри SQLite,
+# агрегаты дописываются тем же запросом, что и при обычной записи
+def generate_data(db_name, rows, interval=1000, end=None):
+    create_db(db_name)
+    end = now_ms() if end is None else end
+    start = end - rows * interval
+    conn = sqlite3.connect(db_name)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        for offset in range(0, rows, GENERATE_CHUNK):
+            count = min(GENERATE_CHUNK, rows - offset)
+            with conn:
+                last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM system_data").fetchone()[0]
+                conn.execute(
+                    f"""
+                    WITH RECURSIVE n(i) AS (SELECT {offset} UNION ALL SELECT i + 1 FROM n WHERE i < {offset + count - 1})
+                    INSERT INTO system_data (timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total)
+                    SELECT
+                        {start} + i * {interval},
+                        (abs(random()) % 1000) / 10.0,
+                        2 * 1024 * 1024 * 1024 + abs(random()) % (4 * 1024 * 1024 * 1024),
+                        8 * 1024 * 1024 * 1024,
+                        200 * 1024 * 1024 * 1024 - i * 1024,
+                        500 * 1024 * 1024 * 1024
+                    FROM n
+                    """
+                )
+                for table, period in ROLLUPS.items():
+                    conn.execute(ROLLUP_SQL.format(table=table, period=period, after="?"), (last_id,))
+    finally:
+        conn.close()
+    return start, end
+
+# Сводка длительностей в миллисекундах
+def summarize(durations):
+    durations = sorted(durations)
+    return {
+        "mean_ms": statistics.fmean(durations) * 1000,
+        "p50_ms": durations[len(durations) // 2] * 1000,
+        "p95_ms": durations[min(int(len(durations) * 0.95), len(durations) - 1)] * 1000,
+        "max_ms": durations[-1] * 1000,
+    }
+
+def timed(function, repeats):
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+# Стоимость такта потока опроса: снимок psutil и рассылка одному подписчику
+def bench_sampler(ticks=SAMPLER_TICKS):
+    sampler = Sampler()
+    sampler.subscribe(lambda sample: None)
+    sampler.tick()
+    return summarize(timed(sampler.tick, ticks))
+
+# Устойчивая скорость записи через BatchWriter, включая обновление агрегатов
+def bench_insert(db_name, rows=INSERT_ROWS):
+    create_db(db_name)
+    row = sample_row(take_sample())
+    writer = BatchWriter(db_name, queue_size=rows + 1)
+    started = time.perf_counter()
+    writer.start()
+    for i in range(rows):
+        writer.put((row[0] + i,) + row[1:])
+    writer.close()
+    elapsed = time.perf_counter() - started
+    return {"rows": rows, "seconds": elapsed, "rows_per_s": rows / elapsed}
+
+# Задержка выборки первой страницы и статистики для диапазонов QUERY_RANGES,
+# расположенных равномерно по всей таблице
+def bench_queries(db_name, start, end, repeats=QUERY_REPEATS):
+    conn = sqlite3.connect(db_name)
+    results = {}
+    try:
+        for name, length in QUERY_RANGES.items():
+            if end - start < length:
+                continue
+            positions = [start + (end - start - length) * i // max(repeats - 1, 1) for i in range(repeats)]
+            pages = iter(positions)
+            results[f"page_{name}"] = summarize(
+                timed(lambda: samples_between(conn, next(pages), limit=tz.HISTORY_PAGE_SIZE), repeats)
+            )
+            ranges = iter(positions)
+
+            def stats():
+                t0 = next(ranges)
+                range_stats(conn, t0, t0 + length)
+
+            results[f"stats_{name}"] = summarize(timed(stats, repeats))
+    finally:
+        conn.close()
+    return results
+
+# Заглушка виджетов Tk: принимает любые вызовы и ничего не рисует
+class StubWidget:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+    # В списке диапазонов выбрано «Всё время»
+    def current(self, index=None):
+        return len(tz.HISTORY_RANGES) - 1
+
+    def get(self):
+        return ""
+
+    def winfo_children(self):
+        return []
+
+class StubRoot(StubWidget):
+    def after(self, ms, function=None, *args):
+        return "after"
+
+    after_idle = after
+
+# Время от вызова show_history до заполнения первой страницы. Без дисплея
+# виджеты заменяются заглушками, тогда измеряются только запросы и подготовка строк
+def bench_history_open(db_name, repeats=5):
+    try:
+        root = tz.tk.Tk()
+        root.withdraw()
+        headless = False
+    except tz.tk.TclError:
+        root = StubRoot()
+        headless = True
+    saved = {}
+    if headless:
+        for module, names in ((tz.tk, ("Toplevel", "Frame", "Label", "Button", "Entry")),
+                              (tz, ("Combobox", "Treeview", "Scrollbar"))):
+            for name in names:
+                saved[module, name] = getattr(module, name)
+                setattr(module, name, StubWidget)
+    try:
+        app = tz.SystemMonitorApp.__new__(tz.SystemMonitorApp)
+        app.root = root
+        app.db_name = db_name
+        app.history_window = None
+        # Статистика считается в фоне и в первую отрисовку не входит
+        app.update_stats = lambda t0, t1=None: None
+
+        def open_history():
+            app.show_history()
+            if not headless:
+                root.update_idletasks()
+                app.history_window.destroy()
+
+        result = summarize(timed(open_history, repeats))
+        result["headless"] = headless
+        return result
+    finally:
+        for (module, name), value in saved.items():
+            setattr(module, name, value)
+        if not headless:
+            root.destroy()
+
+# Число строк из записи вида 10k, 1M или 100000
+def parse_rows(value):
+    multipliers = {"k": 10 ** 3, "m": 10 ** 6}
+    value = value.strip().lower()
+    if value[-1:] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+def run(rows_list, directory, keep=False):
+    results = {
+        "timestamp": now_ms(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "sampler": bench_sampler(),
+        "insert": bench_insert(os.path.join(directory, "bench_insert.db")),
+        "tables": {},
+    }
+    for rows in rows_list:
+        db_name = os.path.join(directory, f"bench_{rows}.db")
+        if not (keep and os.path.exists(db_name)):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_name + suffix):
+                    os.remove(db_name + suffix)
+            started = time.perf_counter()
+            start, end = generate_data(db_name, rows)
+            generated = time.perf_counter() - started
+        else:
+            conn = sqlite3.connect(db_name)
+            start, end = conn.execute("SELECT MIN(timestamp), MAX(timestamp) + 1 FROM system_data").fetchone()
+            conn.close()
+            generated = None
+        # WAL переносится в основной файл, чтобы размер базы был честным
+        conn = sqlite3.connect(db_name)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        size = os.path.getsize(db_name)
+        results["tables"][str(rows)] = {
+            "generate_s": generated,
+            "db_bytes": size,
+            "bytes_per_row": size / rows,
+            "queries": bench_queries(db_name, start, end),
+            "history_open": bench_history_open(db_name),
+        }
+    return results
+
+# Плоский словарь числовых показателей: имя -> значение
+def flatten(results, prefix=""):
+    values = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key != "timestamp":
+            values[name] = value
+    return values
+
+# Показатели, ухудшившиеся больше чем на threshold: для *_per_s хуже
+# меньшее значение, для остальных (время, размер) — большее. Максимумы
+# определяются единичными выбросами и не сравниваются
+def compare(current, previous, threshold=REGRESSION_THRESHOLD):
+    current, previous = flatten(current), flatten(previous)
+    regressions = []
+    for name, value in current.items():
+        old = previous.get(name)
+        if not old or name.endswith((".rows", ".max_ms")):
+            continue
+        change = (old - value) / old if name.endswith("_per_s") else (value - old) / old
+        if change > threshold:
+            regressions.append((name, old, value, change))
+    return regressions
+
+# Замеры записи и истории на синтетических данных:
+#   python -m bench --rows 10k,1M --output bench.json
+#   python -m bench --rows 10k,1M --compare bench.json
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="bench", description="Замеры записи и истории на синтетических данных")
+    parser.add_argument("--rows", default=BENCH_ROWS, help="размеры таблиц через запятую, например 10k,1M,100M")
+    parser.add_argument("--dir", help="каталог для баз данных, по умолчанию временный")
+    parser.add_argument("--keep", action="store_true", help="использовать уже созданные базы из --dir")
+    parser.add_argument("--output", "-o", help="файл результатов JSON, по умолчанию стандартный вывод")
+    parser.add_argument("--compare", metavar="ФАЙЛ", help="результаты прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="допустимое относительное ухудшение")
+    args = parser.parse_args(argv)
+    try:
+        args.rows = [parse_rows(value) for value in args.rows.split(",") if value.strip()]
+    except ValueError:
+        parser.error(f"неверные размеры таблиц: {args.rows}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dir:
+        os.makedirs(args.dir, exist_ok=True)
+        results = run(args.rows, args.dir, args.keep)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run(args.rows, directory)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, ensure_ascii=False, indent=2)
+    else:
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fp:
+            regressions = compare(results, json.load(fp), args.threshold)
+        for name, old, value, change in regressions:
+            print(f"Ухудшение {name}: {old:.4g} -> {value:.4g} ({change:+.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import argparse
+import csv
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, islice
+
+from monitor import DB_NAME, SAMPLE_QUERIES, PRUNE_BATCH, EXPORT_CHUNK_SIZE, iter_samples, time_range
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Столбцы выгрузки в порядке SAMPLE_QUERIES
+EXPORT_COLUMNS = ("id", "timestamp", "cpu_usage", "memory_available", "memory_total", "disk_free", "disk_total")
+
+# Настройки архива
+ARCHIVE_MAGIC = b"TZARCH1\0"
+SEGMENT_ROWS = 65536  # Строк в одном сегменте архива
+COMPRESSION_LEVEL = 6
+# Множитель перед округлением до целого: загрузка ЦП хранится с точностью до сотых
+ARCHIVE_SCALES = {
+    "timestamp": 1,
+    "cpu_usage": 100,
+    "memory_available": 1,
+    "memory_total": 1,
+    "disk_free": 1,
+    "disk_total": 1,
+}
+# Длины заголовка и данных сегмента
+SEGMENT_PREFIX = struct.Struct("<II")
+
+# Выгрузка записей в CSV, строки читаются из базы порциями
+def export_csv(conn, fp, t0=None, t1=None, table="system_data", chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(fp, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    rows = iter_samples(conn, t0, t1, table, chunk_size)
+    count = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return count
+        writer.writerows(chunk)
+        count += len(chunk)
+
+# Выгрузка записей в JSON Lines: по одному объекту на строку
+def export_jsonl(conn, fp, t0=None, t1=None, table="system_data", chunk_size=EXPORT_CHUNK_SIZE):
+    count = 0
+    for row in iter_samples(conn, t0, t1, table, chunk_size):
+        fp.write(json.dumps(dict(zip(EXPORT_COLUMNS, row))))
+        fp.write("\n")
+        count += 1
+    return count
+
+EXPORTERS = {
+    "csv": export_csv,
+    "jsonl": export_jsonl,
+}
+
+# Выгрузка в файл path, формат определяется расширением. Открывает свое
+# соединение, поэтому может выполняться в отдельном потоке
+def export_file(db_name, path, t0=None, t1=None, table="system_data"):
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension not in EXPORTERS:
+        raise ValueError(f"Неизвестный формат выгрузки: {extension or path}")
+    conn = sqlite3.connect(db_name)
+    try:
+        with open(path, "w", encoding="utf-8", newline="") as fp:
+            return EXPORTERS[extension](conn, fp, t0, t1, table)
+    finally:
+        conn.close()
+
+# Значения, умноженные на scale и округленные до целых, в виде разностей
+# соседних значений, сжатых zlib
+def encode_column(values, scale=1):
+    if numpy is not None:
+        values = numpy.asarray(values)
+        # Средние из таблиц агрегатов дробные и тоже округляются
+        if scale != 1 or values.dtype.kind == "f":
+            values = numpy.rint(values * scale)
+        data = numpy.diff(values.astype("<i8"), prepend=0).tobytes()
+    else:
+        values = [round(value * scale) for value in values]
+        data = array("q", [b - a for a, b in zip([0] + values, values)])
+        if sys.byteorder == "big":
+            data.byteswap()
+        data = data.tobytes()
+    return zlib.compress(data, COMPRESSION_LEVEL)
+
+def decode_column(data, scale=1):
+    data = zlib.decompress(data)
+    if numpy is not None:
+        values = numpy.frombuffer(data, dtype="<i8").cumsum()
+        return values / scale if scale != 1 else values
+    deltas = array("q")
+    deltas.frombytes(data)
+    if sys.byteorder == "big":
+        deltas.byteswap()
+    values = list(accumulate(deltas))
+    return [value / scale for value in values] if scale != 1 else values
+
+def encode_segment(rows):
+    columns = list(zip(*rows))
+    header = {"rows": len(rows), "t0": rows[0][1], "t1": rows[-1][1], "columns": {}}
+    blobs = []
+    offset = 0
+    for name, values in zip(EXPORT_COLUMNS[1:], columns[1:]):
+        scale = ARCHIVE_SCALES[name]
+        blob = encode_column(values, scale)
+        header["columns"][name] = [offset, len(blob), scale]
+        blobs.append(blob)
+        offset += len(blob)
+    header = json.dumps(header).encode()
+    return SEGMENT_PREFIX.pack(len(header), offset) + header + b"".join(blobs)
+
+# Архив холодных данных: после сигнатуры идут сегменты по SEGMENT_ROWS строк,
+# в каждом — заголовок JSON с границами времени и смещениями столбцов и сами
+# столбцы, закодированные encode_column. Столбцы читаются независимо друг от друга
+def write_archive(conn, path, t0=None, t1=None, table="system_data", segment_rows=SEGMENT_ROWS):
+    count = 0
+    rows = iter_samples(conn, t0, t1, table, min(segment_rows, EXPORT_CHUNK_SIZE))
+    with open(path, "wb") as fp:
+        fp.write(ARCHIVE_MAGIC)
+        while True:
+            segment = list(islice(rows, segment_rows))
+            if not segment:
+                return count
+            fp.write(encode_segment(segment))
+            count += len(segment)
+
+# Архивация system_data с удалением заархивированных записей. Архив читается
+# обычным запросом, не блокируя запись, затем удаляются порциями только строки
+# до последней заархивированной метки времени включительно: записанное за
+# время архивации остается в базе
+def archive_samples(conn, path, t0=None, t1=None, segment_rows=SEGMENT_ROWS):
+    count = write_archive(conn, path, t0, t1, "system_data", segment_rows)
+    if not count:
+        return count, 0
+    with Archive(path) as archive:
+        last = archive.t1
+    return count, delete_samples(conn, t0, last + 1)
+
+# Удаление уже заархивированных записей порциями по batch строк
+def delete_samples(conn, t0=None, t1=None, batch=PRUNE_BATCH):
+    where, params = time_range(t0, t1)
+    deleted = 0
+    while True:
+        with conn:
+            cursor = conn.execute(
+                f"DELETE FROM system_data WHERE rowid IN (SELECT rowid FROM system_data {where} LIMIT ?)",
+                (*params, batch),
+            )
+        if not cursor.rowcount:
+            return deleted
+        deleted += cursor.rowcount
+
+# Чтение архива через mmap: при открытии разбираются только заголовки
+# сегментов, а столбцы распаковываются по запросу и лишь для сегментов,
+# пересекающихся с запрошенным диапазоном времени
+class Archive:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError(f"Файл не является архивом: {path}")
+        self.segments = []
+        position = len(ARCHIVE_MAGIC)
+        while position < len(self.data):
+            header_size, data_size = SEGMENT_PREFIX.unpack_from(self.data, position)
+            position += SEGMENT_PREFIX.size
+            header = json.loads(self.data[position:position + header_size])
+            header["start"] = position + header_size
+            self.segments.append(header)
+            position += header_size + data_size
+
+    def __len__(self):
+        return sum(segment["rows"] for segment in self.segments)
+
+    @property
+    def t0(self):
+        return self.segments[0]["t0"] if self.segments else None
+
+    @property
+    def t1(self):
+        return self.segments[-1]["t1"] if self.segments else None
+
+    def read(self, segment, name):
+        offset, size, scale = segment["columns"][name]
+        start = segment["start"] + offset
+        return decode_column(self.data[start:start + size], scale)
+
+    # Сегменты с t0 <= timestamp < t1 и срезы строк внутри них
+    def select(self, t0=None, t1=None):
+        for segment in self.segments:
+            if (t0 is not None and segment["t1"] < t0) or (t1 is not None and segment["t0"] >= t1):
+                continue
+            start, stop = 0, segment["rows"]
+            if (t0 is not None and segment["t0"] < t0) or (t1 is not None and segment["t1"] >= t1):
+                timestamps = self.read(segment, "timestamp")
+                if t0 is not None:
+                    start = bisect_left(timestamps, t0)
+                if t1 is not None:
+                    stop = bisect_left(timestamps, t1)
+            yield segment, start, stop
+
+    # Значения столбца name с t0 <= timestamp < t1 по сегментам
+    def column(self, name, t0=None, t1=None):
+        for segment, start, stop in self.select(t0, t1):
+            yield self.read(segment, name)[start:stop]
+
+    # Строки (timestamp, cpu_usage, ...) с t0 <= timestamp < t1
+    def rows(self, t0=None, t1=None):
+        for segment, start, stop in self.select(t0, t1):
+            columns = [self.read(segment, name)[start:stop] for name in EXPORT_COLUMNS[1:]]
+            # Массивы numpy переводятся в обычные числа Python одним вызовом
+            yield from zip(*(column.tolist() if numpy is not None else column for column in columns))
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Локальное время в формате ГГГГ-ММ-ДД[ ЧЧ:ММ[:СС]] в миллисекундах эпохи
+def parse_time(value):
+    for pattern in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return int(time.mktime(time.strptime(value, pattern)) * 1000)
+        except ValueError:
+            pass
+    raise ValueError(f"ожидается ГГГГ-ММ-ДД[ ЧЧ:ММ[:СС]]: {value}")
+
+# Значение параметров --from и --to
+def time_argument(value):
+    try:
+        return parse_time(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp / 1000))
+
+# Выгрузка истории без интерфейса:
+#   python -m export csv --from 2025-01-01 --output january.csv
+#   python -m export archive --to 2025-01-01 --output 2024.tzarch --delete
+#   python -m export info 2024.tzarch
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="export", description="Выгрузка записанной истории")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, text in (("csv", "выгрузка в CSV"), ("jsonl", "выгрузка в JSON Lines"), ("archive", "запись архива")):
+        command = commands.add_parser(name, help=text)
+        command.add_argument("--db", default=DB_NAME, help="путь к базе данных")
+        command.add_argument("--from", dest="t0", type=time_argument, help="начало диапазона, местное время")
+        command.add_argument("--to", dest="t1", type=time_argument, help="конец диапазона, не включается")
+        command.add_argument("--table", default="system_data", choices=SAMPLE_QUERIES, help="таблица записей")
+        command.add_argument("--output", "-o", default="-" if name != "archive" else None, required=name == "archive",
+                             help="файл результата" + (", - — стандартный вывод" if name != "archive" else ""))
+    commands.choices["archive"].add_argument(
+        "--delete", action="store_true",
+        help="удалить заархивированные записи из базы (только system_data)",
+    )
+    info = commands.add_parser("info", help="сведения об архиве")
+    info.add_argument("archive", help="путь к архиву")
+    args = parser.parse_args(argv)
+    if getattr(args, "delete", False) and args.table != "system_data":
+        parser.error("--delete допустим только для таблицы system_data")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "info":
+        with Archive(args.archive) as archive:
+            print(f"Сегментов: {len(archive.segments)}, записей: {len(archive)}")
+            if archive.segments:
+                print(f"С {format_time(archive.t0)} по {format_time(archive.t1)}")
+            print(f"Размер: {os.path.getsize(args.archive)} байт")
+        return
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == "archive":
+            if args.delete:
+                count, deleted = archive_samples(conn, args.output, args.t0, args.t1)
+            else:
+                count = write_archive(conn, args.output, args.t0, args.t1, args.table)
+            print(f"Заархивировано записей: {count}, размер архива {os.path.getsize(args.output)} байт")
+            if args.delete:
+                print(f"Удалено записей: {deleted}")
+        elif args.output == "-":
+            EXPORTERS[args.command](conn, sys.stdout, args.t0, args.t1, args.table)
+        else:
+            with open(args.output, "w", encoding="utf-8", newline="") as fp:
+                count = EXPORTERS[args.command](conn, fp, args.t0, args.t1, args.table)
+            print(f"Выгружено записей: {count}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1364 @@
+import psutil
+import time
+import json
+import operator
+import sqlite3
+import threading
+from array import array
+from heapq import nlargest
+from collections import namedtuple, deque
+from queue import Queue, Empty
+
+
+# Настройки приложения
+UPDATE_INTERVAL = 1  # Интервал обновления в секундах
+DB_NAME = "system_data.db"
+
+# Настройки опроса
+SAMPLE_INTERVAL = UPDATE_INTERVAL  # Интервал опроса в секундах
+MIN_SAMPLE_INTERVAL = 0.01  # Наименьший допустимый интервал опроса (100 Гц)
+SAMPLE_BACKOFF = False  # Увеличивать интервал опроса при перегрузке
+MAX_SAMPLE_INTERVAL = 10  # Предел увеличения интервала при перегрузке
+BACKOFF_RECOVERY_TICKS = 100  # Спокойных тактов до уменьшения интервала обратно
+
+# Настройки записи в базу данных
+BATCH_SIZE = 50  # Максимальное число записей в одной транзакции
+FLUSH_INTERVAL = 5  # Максимальная задержка сброса буфера в секундах
+QUEUE_SIZE = 1000  # Ёмкость очереди записи
+DB_SYNCHRONOUS = "NORMAL"  # Режим PRAGMA synchronous: OFF, NORMAL или FULL
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+DB_BUSY_TIMEOUT = 30  # Сколько секунд запись ждет, пока база заблокирована другим соединением
+WRITE_RETRY_INTERVAL = 1  # Пауза перед повтором записи заблокированной базы в секундах
+
+# Настройки сбора данных о процессах
+PROCESS_TOP_N = 0  # Сколько самых нагруженных процессов записывать, 0 — не записывать
+PROCESS_INTERVAL = 5  # Интервал опроса процессов в секундах
+PROCESS_ATTRS = ["name", "cpu_percent", "memory_info"]
+
+# Дополнительные сборщики метрик, включенные по умолчанию (см. COLLECTORS)
+ENABLED_COLLECTORS = ["cpu_cores", "swap", "load_average", "disk_io", "net_io", "disks"]
+
+# Таблицы агрегатов: имя таблицы и длительность интервала в миллисекундах
+ROLLUPS = {
+    "system_data_1m": 60 * 1000,
+    "system_data_1h": 60 * 60 * 1000,
+}
+
+# Срок хранения в секундах для каждой таблицы, None — хранить всегда
+RETENTION = {
+    "system_data": 7 * 24 * 60 * 60,
+    "system_data_1m": 90 * 24 * 60 * 60,
+    "system_data_1h": None,
+    "process_data": 7 * 24 * 60 * 60,
+    "metric_data": 7 * 24 * 60 * 60,
+    "alerts": None,
+}
+PRUNE_BATCH = 500  # Максимум строк одной таблицы, удаляемых за один проход
+
+# Максимум точек в выбранном диапазоне истории
+HISTORY_MAX_POINTS = 5000
+
+# Статистика истории
+PERCENTILES = (95, 99)
+STATS_MAX_POINTS = 10 ** 5  # Записей не больше на расчет, длинные диапазоны считаются по агрегатам
+
+# Экспорт
+EXPORT_CHUNK_SIZE = 10000  # Строк, читаемых из курсора за раз
+
+# Самодиагностика: гистограммы задержек опроса, записи и окна, глубина
+# очередей и потребление процесса. Выключенная не замеряет ничего
+INSTRUMENTATION = False
+HISTOGRAM_BUCKETS = 40  # Интервалы гистограммы: до 1 мкс, до 2 мкс, ... до 2 ** 38 мкс
+
+# Правила оповещений: имя, метрика (см. ALERT_METRICS), показатель окна
+# (min, max или avg), сравнение, порог и длительность окна в секундах.
+# Например, минимум загрузки ЦП за 60 с выше 90% — ЦП занят все 60 с
+ALERT_RULES = [
+    ("Высокая загрузка ЦП", "cpu_usage", "min", ">", 90, 60),
+    ("Мало свободной ОЗУ", "memory_available", "max", "<", 0.5, 30),
+    ("Мало места на диске", "disk_free", "max", "<", 5, 0),
+]
+
+# Запросы вставки для каждой таблицы, в которую пишет BatchWriter
+INSERT_SQL = {
+    "system_data": (
+        "INSERT INTO system_data (timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total) "
+        "VALUES (?, ?, ?, ?, ?, ?)"
+    ),
+    "process_data": "INSERT INTO process_data (timestamp, pid, name, cpu_usage, rss) VALUES (?, ?, ?, ?, ?)",
+    "metric_data": "INSERT INTO metric_data (timestamp, metric_id, value) VALUES (?, ?, ?)",
+    "alerts": "INSERT INTO alerts (timestamp, rule, state, value) VALUES (?, ?, ?, ?)",
+}
+
+# Агрегация записей system_data с id > {after} в таблицу {table} с шагом {period} мс:
+# новые интервалы добавляются, уже существующие дополняются
+ROLLUP_SQL = """
+    INSERT INTO {table} (
+        timestamp, samples, cpu_min, cpu_max, cpu_sum,
+        memory_available_min, memory_available_max, memory_available_sum, memory_total,
+        disk_free_min, disk_free_max, disk_free_sum, disk_total
+    )
+    SELECT
+        timestamp / {period} * {period}, COUNT(*), MIN(cpu_usage), MAX(cpu_usage), SUM(cpu_usage),
+        MIN(memory_available), MAX(memory_available), SUM(memory_available), MAX(memory_total),
+        MIN(disk_free), MAX(disk_free), SUM(disk_free), MAX(disk_total)
+    FROM system_data
+    WHERE id > {after}
+    GROUP BY timestamp / {period}
+    ON CONFLICT(timestamp) DO UPDATE SET
+        samples = samples + excluded.samples,
+        cpu_min = MIN(cpu_min, excluded.cpu_min),
+        cpu_max = MAX(cpu_max, excluded.cpu_max),
+        cpu_sum = cpu_sum + excluded.cpu_sum,
+        memory_available_min = MIN(memory_available_min, excluded.memory_available_min),
+        memory_available_max = MAX(memory_available_max, excluded.memory_available_max),
+        memory_available_sum = memory_available_sum + excluded.memory_available_sum,
+        memory_total = excluded.memory_total,
+        disk_free_min = MIN(disk_free_min, excluded.disk_free_min),
+        disk_free_max = MAX(disk_free_max, excluded.disk_free_max),
+        disk_free_sum = disk_free_sum + excluded.disk_free_sum,
+        disk_total = excluded.disk_total;
+"""
+
+ROLLUP_TABLE_SQL = """
+    CREATE TABLE {table} (
+        timestamp INTEGER PRIMARY KEY,
+        samples INTEGER,
+        cpu_min REAL,
+        cpu_max REAL,
+        cpu_sum REAL,
+        memory_available_min INTEGER,
+        memory_available_max INTEGER,
+        memory_available_sum INTEGER,
+        memory_total INTEGER,
+        disk_free_min INTEGER,
+        disk_free_max INTEGER,
+        disk_free_sum INTEGER,
+        disk_total INTEGER
+    );
+"""
+
+# Миграции схемы базы данных. Номер версии хранится в PRAGMA user_version,
+# миграция с индексом i переводит базу из версии i в версию i + 1
+MIGRATIONS = [
+    # 1: исходная схема — время строкой, память и диск в ГБ
+    """
+    CREATE TABLE IF NOT EXISTS system_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        cpu_usage REAL,
+        memory_available REAL,
+        memory_total REAL,
+        disk_free REAL,
+        disk_total REAL
+    );
+    """,
+    # 2: время в миллисекундах эпохи UTC, память и диск в байтах, индекс по времени.
+    # Данные переносятся одним INSERT ... SELECT внутри SQLite
+    """
+    CREATE TABLE system_data_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER,
+        cpu_usage REAL,
+        memory_available INTEGER,
+        memory_total INTEGER,
+        disk_free INTEGER,
+        disk_total INTEGER
+    );
+    INSERT INTO system_data_new (id, timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total)
+    SELECT
+        id,
+        CAST(strftime('%s', timestamp, 'utc') AS INTEGER) * 1000,
+        cpu_usage,
+        CAST(ROUND(memory_available * 1073741824) AS INTEGER),
+        CAST(ROUND(memory_total * 1073741824) AS INTEGER),
+        CAST(ROUND(disk_free * 1073741824) AS INTEGER),
+        CAST(ROUND(disk_total * 1073741824) AS INTEGER)
+    FROM system_data;
+    DROP TABLE system_data;
+    ALTER TABLE system_data_new RENAME TO system_data;
+    CREATE INDEX idx_system_data_timestamp ON system_data (timestamp);
+    """,
+    # 3: таблицы агрегатов, заполняемые по уже записанным данным
+    "".join(
+        ROLLUP_TABLE_SQL.format(table=table) + ROLLUP_SQL.format(table=table, period=period, after=0)
+        for table, period in ROLLUPS.items()
+    ),
+    # 4: самые нагруженные процессы
+    """
+    CREATE TABLE process_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER,
+        pid INTEGER,
+        name TEXT,
+        cpu_usage REAL,
+        rss INTEGER
+    );
+    CREATE INDEX idx_process_data_timestamp ON process_data (timestamp);
+    """,
+    # 5: метрики дополнительных сборщиков в узком формате: справочник имен
+    # и по одной строке на значение, так что новые метрики не меняют схему
+    """
+    CREATE TABLE metrics (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE metric_data (
+        timestamp INTEGER,
+        metric_id INTEGER REFERENCES metrics (id),
+        value REAL
+    );
+    CREATE INDEX idx_metric_data_metric_timestamp ON metric_data (metric_id, timestamp);
+    CREATE INDEX idx_metric_data_timestamp ON metric_data (timestamp);
+    """,
+    # 6: журнал оповещений
+    """
+    CREATE TABLE alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER,
+        rule TEXT,
+        state TEXT,
+        value REAL
+    );
+    CREATE INDEX idx_alerts_timestamp ON alerts (timestamp);
+    """,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Инструкции сценария по отдельности: executescript завершает открытую
+# транзакцию, поэтому внутри BEGIN IMMEDIATE инструкции выполняются по одной
+def split_script(script):
+    statements, current = [], ""
+    for part in script.split(";"):
+        current += part + ";"
+        if sqlite3.complete_statement(current):
+            if current.strip(" \t\n;"):
+                statements.append(current)
+            current = ""
+    return statements
+
+# Применение недостающих миграций, каждая — в отдельной транзакции. Версия
+# перечитывается под блокировкой BEGIN IMMEDIATE, поэтому миграцию, уже
+# примененную другим процессом (интерфейс и регистратор запущены вместе), он пропускает
+def migrate_db(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Версия базы данных {version} новее поддерживаемой {SCHEMA_VERSION}")
+    while version < SCHEMA_VERSION:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                for statement in split_script(MIGRATIONS[version]):
+                    conn.execute(statement)
+                version += 1
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+# Подключение к базе данных в режиме WAL
+def connect_db(db_name=DB_NAME, synchronous=DB_SYNCHRONOUS, timeout=DB_BUSY_TIMEOUT):
+    if synchronous.upper() not in SYNCHRONOUS_MODES:
+        raise ValueError(f"Недопустимый режим synchronous: {synchronous}")
+    conn = sqlite3.connect(db_name, timeout=timeout, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={synchronous.upper()}")
+    return conn
+
+# Создание базы данных и таблицы или обновление существующей
+def create_db(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name, timeout=DB_BUSY_TIMEOUT)
+    try:
+        migrate_db(conn)
+    finally:
+        conn.close()
+
+# Ошибка из-за блокировки базы другим соединением: запись можно повторить
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+# Текущее время в миллисекундах эпохи
+def now_ms():
+    return int(time.time() * 1000)
+
+# Запросы, возвращающие записи в едином виде
+# (id, timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total).
+# В таблицах агрегатов id совпадает с началом интервала, а значения усреднены
+SAMPLE_QUERIES = {
+    "system_data": (
+        "SELECT id, timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total FROM system_data"
+    ),
+    **{
+        table: (
+            "SELECT timestamp, timestamp, cpu_sum / samples, memory_available_sum / samples, memory_total, "
+            f"disk_free_sum / samples, disk_total FROM {table}"
+        )
+        for table in ROLLUPS
+    },
+}
+
+# Разрешения истории от подробного к грубому: таблица и шаг в миллисекундах
+RESOLUTIONS = [("system_data", SAMPLE_INTERVAL * 1000), *ROLLUPS.items()]
+
+# Выборка записей с t0 <= timestamp < t1 (в миллисекундах, None — без границы)
+# в порядке времени. Для постраничного чтения передается ключ (timestamp, id)
+# последней полученной записи в after или первой — в before
+def samples_between(conn, t0=None, t1=None, after=None, before=None, limit=None, table="system_data"):
+    conditions, params = [], []
+    if t0 is not None:
+        conditions.append("timestamp >= ?")
+        params.append(t0)
+    if t1 is not None:
+        conditions.append("timestamp < ?")
+        params.append(t1)
+    if after is not None:
+        conditions.append("(timestamp, rowid) > (?, ?)")
+        params.extend(after)
+    if before is not None:
+        conditions.append("(timestamp, rowid) < (?, ?)")
+        params.extend(before)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "DESC" if before is not None else "ASC"
+    query = f"{SAMPLE_QUERIES[table]} {where} ORDER BY timestamp {order}, rowid {order}"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    rows = conn.execute(query, params).fetchall()
+    return rows[::-1] if before is not None else rows
+
+# Условие WHERE для t0 <= timestamp < t1 (None — без границы) и его параметры
+def time_range(t0=None, t1=None):
+    conditions, params = [], []
+    if t0 is not None:
+        conditions.append("timestamp >= ?")
+        params.append(t0)
+    if t1 is not None:
+        conditions.append("timestamp < ?")
+        params.append(t1)
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+# Потоковое чтение записей с t0 <= timestamp < t1 в порядке времени: строки
+# выдаются порциями по chunk_size, поэтому память не зависит от длины диапазона
+def iter_samples(conn, t0=None, t1=None, table="system_data", chunk_size=EXPORT_CHUNK_SIZE):
+    where, params = time_range(t0, t1)
+    cursor = conn.execute(f"{SAMPLE_QUERIES[table]} {where} ORDER BY timestamp, rowid", params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+# Последние n записей в порядке времени
+def latest(conn, n):
+    rows = conn.execute("SELECT * FROM system_data ORDER BY timestamp DESC, id DESC LIMIT ?", (n,)).fetchall()
+    return rows[::-1]
+
+# Значения метрики name с t0 <= timestamp < t1 в виде пар (timestamp, value)
+def metric_between(conn, name, t0=None, t1=None):
+    conditions, params = ["metrics.name = ?"], [name]
+    if t0 is not None:
+        conditions.append("metric_data.timestamp >= ?")
+        params.append(t0)
+    if t1 is not None:
+        conditions.append("metric_data.timestamp < ?")
+        params.append(t1)
+    return conn.execute(
+        "SELECT metric_data.timestamp, metric_data.value FROM metric_data "
+        "JOIN metrics ON metrics.id = metric_data.metric_id "
+        f"WHERE {' AND '.join(conditions)} ORDER BY metric_data.timestamp",
+        params,
+    ).fetchall()
+
+# Имена всех записанных метрик
+def metric_names(conn):
+    return [row[0] for row in conn.execute("SELECT name FROM metrics ORDER BY name")]
+
+# Время самой ранней записи среди всех таблиц или None, если данных нет
+def first_timestamp(conn):
+    values = [conn.execute(f"SELECT MIN(timestamp) FROM {table}").fetchone()[0] for table in SAMPLE_QUERIES]
+    values = [value for value in values if value is not None]
+    return min(values) if values else None
+
+# Выражения статистики для каждой таблицы: число снимков и для каждой
+# метрики — минимум, максимум, среднее и значение одной строки для
+# перцентилей. В таблицах агрегатов минимум, максимум и среднее точные,
+# а перцентили считаются по средним за интервал
+def used_expression(available, total):
+    return f"100.0 * ({total} - {available}) / {total}"
+
+STATS_EXPRESSIONS = {
+    "system_data": (
+        "COUNT(*)",
+        {
+            "cpu_usage": ("MIN(cpu_usage)", "MAX(cpu_usage)", "AVG(cpu_usage)", "cpu_usage"),
+            **{
+                metric: (
+                    f"MIN({used_expression(available, total)})",
+                    f"MAX({used_expression(available, total)})",
+                    f"AVG({used_expression(available, total)})",
+                    used_expression(available, total),
+                )
+                for metric, available, total in (
+                    ("memory_used", "memory_available", "memory_total"),
+                    ("disk_used", "disk_free", "disk_total"),
+                )
+            },
+        },
+    ),
+    **{
+        table: (
+            "SUM(samples)",
+            {
+                "cpu_usage": ("MIN(cpu_min)", "MAX(cpu_max)", "SUM(cpu_sum) / SUM(samples)", "cpu_sum / samples"),
+                **{
+                    metric: (
+                        f"MIN({used_expression(available + '_max', total)})",
+                        f"MAX({used_expression(available + '_min', total)})",
+                        f"100.0 * SUM({total} * samples - {available}_sum) / SUM({total} * samples)",
+                        used_expression(f"{available}_sum / samples", total),
+                    )
+                    for metric, available, total in (
+                        ("memory_used", "memory_available", "memory_total"),
+                        ("disk_used", "disk_free", "disk_total"),
+                    )
+                },
+            },
+        )
+        for table in ROLLUPS
+    },
+}
+
+Stats = namedtuple("Stats", "min max avg p95 p99")
+
+# Статистика метрик с t0 <= timestamp < t1: число снимков и словарь метрика -> Stats.
+# Минимум, максимум и среднее считаются в SQL по индексу времени, перцентили —
+# по гистограммам, тоже собранным в SQL, так что в Python попадают только
+# различные значения, а не строки
+def range_stats(conn, t0=None, t1=None, table="system_data"):
+    count_expression, metrics = STATS_EXPRESSIONS[table]
+    where, params = time_range(t0, t1)
+    aggregates = [count_expression] + [expression for exprs in metrics.values() for expression in exprs[:3]]
+    row = conn.execute(f"SELECT {', '.join(aggregates)} FROM {table} {where}", params).fetchone()
+    if not row[0]:
+        return 0, {}
+    stats = {}
+    for i, (metric, exprs) in enumerate(metrics.items()):
+        ranks = histogram_percentiles(conn, exprs[3], table, where, params)
+        stats[metric] = Stats(*row[1 + 3 * i:4 + 3 * i], *ranks)
+    return row[0], stats
+
+# Самая подробная таблица для статистики, в которой строк диапазона не больше
+# max_rows. Число строк считается по базе, а не по SAMPLE_INTERVAL: регистратор
+# мог писать чаще. Подсчет останавливается на max_rows + 1 строке
+def stats_resolution(conn, t0, t1=None, max_rows=STATS_MAX_POINTS):
+    names = [name for name, _ in RESOLUTIONS]
+    where, params = time_range(t0, t1)
+    for table in names[names.index(pick_resolution(t0, t1, max_points=max_rows)):-1]:
+        rows = conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} {where} LIMIT ?)", (*params, max_rows + 1)
+        ).fetchone()[0]
+        if rows <= max_rows:
+            return table
+    return names[-1]
+
+# Перцентили PERCENTILES по ближайшему рангу из гистограммы с шагом 0.01
+def histogram_percentiles(conn, expression, table, where, params):
+    histogram = conn.execute(
+        f"SELECT ROUND({expression}, 2) AS value, COUNT(*) FROM {table} {where} "
+        "GROUP BY value HAVING value IS NOT NULL ORDER BY value",
+        params,
+    ).fetchall()
+    total = sum(count for _, count in histogram)
+    result = []
+    for percent in PERCENTILES:
+        rank = -(-percent * total // 100)
+        seen = 0
+        for value, count in histogram:
+            seen += count
+            if seen >= rank:
+                result.append(value)
+                break
+        else:
+            result.append(None)
+    return tuple(result)
+
+# Выбор самой подробной таблицы, в которой диапазон от t0 до t1 укладывается
+# в max_points точек и еще не удален политикой хранения
+def pick_resolution(t0, t1=None, retention=RETENTION, max_points=HISTORY_MAX_POINTS):
+    now = now_ms()
+    t1 = now if t1 is None else t1
+    for table, step in RESOLUTIONS:
+        keep = retention.get(table)
+        if keep is not None and t0 < now - keep * 1000:
+            continue
+        if (t1 - t0) / step <= max_points:
+            return table
+    return RESOLUTIONS[-1][0]
+
+# Гистограмма длительностей с интервалами по степеням двойки микросекунд:
+# запись — O(1) без выделения памяти, перцентили оцениваются сверху границей интервала
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1) if seconds > 0 else 0
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # Верхняя граница интервала, в который попадает percent процентов значений, в секундах
+    def percentile(self, percent):
+        rank = -(-percent * self.count // 100)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(2 ** index / 1e6, self.max)
+        return 0.0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+# Счетчики самодиагностики. В горячих местах замер выполняется только при
+# enabled, поэтому выключенная диагностика стоит одну проверку атрибута
+class Diagnostics:
+    def __init__(self, enabled=INSTRUMENTATION):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.gauges = {}
+        self.started = time.monotonic()
+        self.process = psutil.Process()
+        if enabled:
+            self.enable()
+
+    def enable(self):
+        if not self.enabled:
+            self.reset()
+            self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.gauges = {}
+            self.started = time.monotonic()
+        # Первый вызов cpu_percent лишь запоминает базовые значения
+        self.process.cpu_percent(interval=None)
+
+    # Длительность операции name в секундах
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    # Текущее значение величины name, например глубины очереди; запоминается и наибольшее
+    def gauge(self, name, value):
+        with self.lock:
+            _, peak = self.gauges.get(name, (0, value))
+            self.gauges[name] = (value, max(peak, value))
+
+    def snapshot(self):
+        with self.process.oneshot():
+            process = {
+                "cpu_percent": self.process.cpu_percent(interval=None),
+                "rss": self.process.memory_info().rss,
+                "threads": self.process.num_threads(),
+            }
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "timestamp": now_ms(),
+                "uptime": time.monotonic() - self.started,
+                "process": process,
+                "latency": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+                "gauges": {name: {"value": value, "max": peak} for name, (value, peak) in sorted(self.gauges.items())},
+            }
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(self.snapshot(), fp, ensure_ascii=False, indent=2)
+
+# Общие счетчики самодиагностики приложения
+diagnostics = Diagnostics()
+
+# Получение данных о загрузке
+def get_system_data():
+    cpu_usage = psutil.cpu_percent(interval=None)
+    memory_usage = psutil.virtual_memory()
+    disk_usage = psutil.disk_usage('/')
+    return cpu_usage, memory_usage, disk_usage
+
+# Снимок состояния системы: время в миллисекундах эпохи и по монотонным часам
+# (в секундах), загрузка ЦП в процентах, память и диск в байтах
+Sample = namedtuple(
+    "Sample", "timestamp monotonic cpu_usage memory_available memory_total disk_free disk_total"
+)
+
+def take_sample():
+    cpu_usage, memory_usage, disk_usage = get_system_data()
+    return Sample(
+        now_ms(),
+        time.monotonic(),
+        cpu_usage,
+        memory_usage.available,
+        memory_usage.total,
+        disk_usage.free,
+        disk_usage.total,
+    )
+
+# Строка таблицы system_data для снимка
+def sample_row(sample):
+    return (
+        sample.timestamp,
+        sample.cpu_usage,
+        sample.memory_available,
+        sample.memory_total,
+        sample.disk_free,
+        sample.disk_total,
+    )
+
+# Планировщик тактов по монотонным часам: k-й такт приходится на
+# start + k * interval, поэтому время работы не сдвигает сетку. Если такт
+# опоздал больше чем на интервал, пропущенные такты не догоняются, а
+# учитываются в missed. При backoff=True перегрузка удваивает интервал
+# (до max_interval), а BACKOFF_RECOVERY_TICKS спокойных тактов уменьшают его обратно
+class DeadlineScheduler:
+    def __init__(self, interval, backoff=SAMPLE_BACKOFF, max_interval=MAX_SAMPLE_INTERVAL):
+        self.base_interval = interval
+        self.interval = interval
+        self.backoff = backoff
+        self.max_interval = max(max_interval, interval)
+        self.deadline = None
+        self.missed = 0
+        self.lag = 0.0
+        self.calm_ticks = 0
+
+    # Переход к следующему такту; возвращает задержку до него в секундах
+    def advance(self):
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now + self.interval
+            return self.interval
+
+        # Время от планового начала завершенного такта, включая его опоздание
+        busy = now - self.deadline
+        self.lag = max(busy, 0.0)
+        self.deadline += self.interval
+        if now >= self.deadline + self.interval:
+            skipped = int((now - self.deadline) // self.interval)
+            self.deadline += skipped * self.interval
+            self.missed += skipped
+            if self.backoff:
+                self.calm_ticks = 0
+                self.interval = min(self.interval * 2, self.max_interval)
+                self.deadline = now + self.interval
+        elif self.backoff and self.interval > self.base_interval and busy < self.interval / 4:
+            self.calm_ticks += 1
+            if self.calm_ticks >= BACKOFF_RECOVERY_TICKS:
+                self.calm_ticks = 0
+                self.interval = max(self.interval / 2, self.base_interval)
+        return max(self.deadline - now, 0.0)
+
+    # Ожидание следующего такта; возвращает False, если stop_event установлен
+    def wait(self, stop_event):
+        return not stop_event.wait(self.advance())
+
+# Единственный опрашивающий psutil поток: раз в interval секунд делает один
+# снимок и передает его всем подписчикам. Подписчики вызываются в потоке
+# опроса и должны работать быстро
+class Sampler(threading.Thread):
+    def __init__(self, interval=SAMPLE_INTERVAL, backoff=SAMPLE_BACKOFF):
+        super().__init__(daemon=True)
+        if interval < MIN_SAMPLE_INTERVAL:
+            raise ValueError(f"Интервал опроса меньше {MIN_SAMPLE_INTERVAL} с: {interval}")
+        self.scheduler = DeadlineScheduler(interval, backoff)
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.subscribers = self.subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        # Дожидается окончания текущей рассылки, после выхода callback больше не вызывается
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if s != callback]
+
+    def tick(self):
+        timing = diagnostics.enabled
+        if timing:
+            started = time.perf_counter()
+        sample = take_sample()
+        if timing:
+            sampled = time.perf_counter()
+            diagnostics.record("sample", sampled - started)
+        with self.lock:
+            for callback in self.subscribers:
+                try:
+                    callback(sample)
+                except Exception as e:
+                    print(f"Ошибка обработки данных: {e}")
+        if timing:
+            diagnostics.record("publish", time.perf_counter() - sampled)
+        return sample
+
+    def run(self):
+        # Первый вызов cpu_percent лишь запоминает базовые значения
+        psutil.cpu_percent(interval=None)
+        while self.scheduler.wait(self.stop_event):
+            if diagnostics.enabled:
+                # Насколько позже плановой границы такта проснулся поток
+                diagnostics.record("sample_lag", time.monotonic() - self.scheduler.deadline)
+            self.tick()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+# Кольцевой буфер последних capacity снимков: по одному массиву array('d')
+# фиксированного размера на каждое поле снимка. Не потокобезопасен —
+# пополняется и читается из одного потока
+class RingBuffer:
+    def __init__(self, capacity, fields=Sample._fields):
+        self.capacity = capacity
+        self.fields = fields
+        self.columns = {field: array("d", bytes(8 * capacity)) for field in fields}
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, sample):
+        position = (self.start + self.size) % self.capacity
+        for field in self.fields:
+            self.columns[field][position] = getattr(sample, field)
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    # Значения поля в порядке записи, от старых к новым
+    def column(self, field):
+        values = self.columns[field]
+        end = self.start + self.size
+        if end <= self.capacity:
+            return values[self.start:end]
+        return values[self.start:] + values[:end - self.capacity]
+
+    def last(self, field):
+        if not self.size:
+            raise IndexError("буфер пуст")
+        return self.columns[field][(self.start + self.size - 1) % self.capacity]
+
+# Фоновая запись в базу данных: записи копятся в очереди и сбрасываются
+# одной транзакцией каждые batch_size записей или flush_interval секунд
+class BatchWriter(threading.Thread):
+    _STOP = object()
+
+    def __init__(self, db_name=DB_NAME, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 queue_size=QUEUE_SIZE, synchronous=DB_SYNCHRONOUS, retention=RETENTION, prune_batch=PRUNE_BATCH,
+                 timeout=DB_BUSY_TIMEOUT):
+        super().__init__(daemon=True)
+        self.db_name = db_name
+        self.timeout = timeout
+        self.retention = retention
+        self.prune_batch = prune_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self.queue = Queue(maxsize=queue_size)
+        self.metric_ids = {}
+
+    def put(self, row, table="system_data"):
+        # При заполненной очереди блокируется, пока запись не догонит
+        self.queue.put((table, row))
+
+    def put_many(self, rows, table):
+        for row in rows:
+            self.put(row, table)
+
+    def close(self):
+        # Сбрасывает оставшиеся записи и дожидается завершения потока
+        if self.is_alive():
+            self.queue.put(self._STOP)
+            self.join()
+
+    def run(self):
+        conn = connect_db(self.db_name, self.synchronous, self.timeout)
+        buffer = []
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except Empty:
+                    item = None
+                if item is self._STOP:
+                    break
+                if item is not None:
+                    if not buffer:
+                        deadline = time.monotonic() + self.flush_interval
+                    buffer.append(item)
+                if buffer and (len(buffer) >= self.batch_size or time.monotonic() >= deadline):
+                    if diagnostics.enabled:
+                        diagnostics.gauge("writer_queue", self.queue.qsize())
+                    if self.flush(conn, buffer):
+                        self.prune(conn)
+                        buffer = []
+                        deadline = None
+                    else:
+                        # База заблокирована: буфер сохраняется до следующей попытки
+                        deadline = time.monotonic() + WRITE_RETRY_INTERVAL
+            self.flush(conn, buffer)
+            self.prune(conn)
+        finally:
+            conn.close()
+
+    # Запись буфера одной транзакцией. False — база заблокирована и записи
+    # нужно повторить, остальные ошибки записи отбрасывают буфер
+    def flush(self, conn, items):
+        if not items:
+            return True
+        timing = diagnostics.enabled
+        if timing:
+            started = time.perf_counter()
+        tables = {}
+        for table, row in items:
+            tables.setdefault(table, []).append(row)
+        try:
+            with conn:
+                last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM system_data").fetchone()[0]
+                for table, rows in tables.items():
+                    if table == "metric_data":
+                        rows = self.resolve_metrics(conn, rows)
+                    conn.executemany(INSERT_SQL[table], rows)
+                # Агрегаты дополняются только что записанными строками
+                if "system_data" in tables:
+                    for table, period in ROLLUPS.items():
+                        conn.execute(ROLLUP_SQL.format(table=table, period=period, after="?"), (last_id,))
+        except sqlite3.Error as e:
+            # id метрик из откатанной транзакции недействительны
+            self.metric_ids.clear()
+            if is_busy(e):
+                print(f"База данных занята, запись будет повторена: {e}")
+                return False
+            print(f"Ошибка записи в базу данных: {e}")
+        if timing:
+            diagnostics.record("db_write", time.perf_counter() - started)
+        return True
+
+    # Замена имен метрик в строках (timestamp, name, value) на их id в таблице metrics
+    def resolve_metrics(self, conn, rows):
+        names = {name for _, name, _ in rows if name not in self.metric_ids}
+        if names:
+            conn.executemany("INSERT OR IGNORE INTO metrics (name) VALUES (?)", [(name,) for name in names])
+            for name in names:
+                self.metric_ids[name] = conn.execute("SELECT id FROM metrics WHERE name = ?", (name,)).fetchone()[0]
+        return [(timestamp, self.metric_ids[name], value) for timestamp, name, value in rows]
+
+    # Удаление устаревших строк небольшими порциями, чтобы не задерживать запись
+    def prune(self, conn):
+        timing = diagnostics.enabled
+        if timing:
+            started = time.perf_counter()
+        try:
+            with conn:
+                for table, seconds in self.retention.items():
+                    if seconds is None:
+                        continue
+                    conn.execute(
+                        f"DELETE FROM {table} WHERE rowid IN "
+                        f"(SELECT rowid FROM {table} WHERE timestamp < ? ORDER BY timestamp LIMIT ?)",
+                        (now_ms() - seconds * 1000, self.prune_batch),
+                    )
+        except sqlite3.Error as e:
+            print(f"Ошибка очистки базы данных: {e}")
+        if timing:
+            diagnostics.record("db_prune", time.perf_counter() - started)
+
+# Сбор top_n самых нагруженных процессов по ЦП и по RSS. Объекты
+# Процессы перебираются через psutil.process_iter: он хранит объекты Process
+# между вызовами, поэтому cpu_percent считается от предыдущего замера, а новый
+# объект создается только для нового процесса или PID, занятого другим процессом
+class ProcessCollector:
+    table = "process_data"
+
+    def __init__(self, top_n=PROCESS_TOP_N, interval=PROCESS_INTERVAL):
+        self.top_n = top_n
+        self.interval = interval
+        self.processes = {}
+
+    def reset(self):
+        self.processes = {}
+
+    def collect(self, timestamp):
+        processes = {}
+        stats = []
+        for process in psutil.process_iter(attrs=PROCESS_ATTRS):
+            info = process.info
+            processes[process.pid] = process
+            # Первый вызов cpu_percent для нового процесса всегда возвращает 0
+            if self.processes.get(process.pid) is not process:
+                continue
+            rss = info["memory_info"].rss if info["memory_info"] else 0
+            stats.append((info["cpu_percent"] or 0.0, rss, process.pid, info["name"]))
+        self.processes = processes
+
+        top = set(nlargest(self.top_n, stats, key=lambda stat: stat[0]))
+        top.update(nlargest(self.top_n, stats, key=lambda stat: stat[1]))
+        return [(timestamp, pid, name, cpu_usage, rss) for cpu_usage, rss, pid, name in sorted(top, reverse=True)]
+
+# Реестр сборщиков метрик: имя -> класс
+COLLECTORS = {}
+
+def register_collector(cls):
+    COLLECTORS[cls.name] = cls
+    return cls
+
+# Базовый класс сборщика метрик для таблицы metric_data. Подкласс задает
+# name, interval по умолчанию и read(), возвращающий словарь {метрика: значение}.
+# Для счетчиков (counter = True) записывается скорость изменения в секунду
+class MetricCollector:
+    table = "metric_data"
+    name = None
+    interval = 5
+    counter = False
+
+    def __init__(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+        self.previous = None
+
+    def read(self):
+        raise NotImplementedError
+
+    # Сброс состояния между запусками записи: после паузы скорость не должна
+    # усредняться по всей паузе
+    def reset(self):
+        self.previous = None
+
+    def collect(self, timestamp):
+        values = self.read()
+        if self.counter:
+            values = self.rates(values)
+        return [(timestamp, f"{self.name}.{metric}", value) for metric, value in values.items()]
+
+    # Скорость по разности с предыдущим замером; сброшенные счетчики пропускаются
+    def rates(self, values):
+        now = time.monotonic()
+        previous, self.previous = self.previous, (now, values)
+        if previous is None:
+            return {}
+        elapsed = now - previous[0]
+        if elapsed <= 0:
+            return {}
+        return {
+            metric: (value - previous[1][metric]) / elapsed
+            for metric, value in values.items()
+            if metric in previous[1] and value >= previous[1][metric]
+        }
+
+@register_collector
+class CpuCoresCollector(MetricCollector):
+    name = "cpu_cores"
+    interval = 5
+
+    def __init__(self, interval=None):
+        super().__init__(interval)
+        self.primed = False
+
+    def reset(self):
+        super().reset()
+        self.primed = False
+
+    def read(self):
+        # Базовые значения percpu хранятся в psutil отдельно от общей загрузки ЦП;
+        # первый вызов лишь запоминает их
+        values = psutil.cpu_percent(percpu=True)
+        if not self.primed:
+            self.primed = True
+            return {}
+        return {f"{core}.percent": value for core, value in enumerate(values)}
+
+@register_collector
+class SwapCollector(MetricCollector):
+    name = "swap"
+    interval = 5
+
+    def read(self):
+        swap = psutil.swap_memory()
+        return {"used": swap.used, "total": swap.total}
+
+@register_collector
+class LoadAverageCollector(MetricCollector):
+    name = "load_average"
+    interval = 5
+
+    def read(self):
+        load_1, load_5, load_15 = psutil.getloadavg()
+        return {"1m": load_1, "5m": load_5, "15m": load_15}
+
+@register_collector
+class DiskIOCollector(MetricCollector):
+    name = "disk_io"
+    interval = 5
+    counter = True
+
+    def read(self):
+        counters = psutil.disk_io_counters()
+        if counters is None:
+            return {}
+        return {
+            "read_bytes": counters.read_bytes,
+            "write_bytes": counters.write_bytes,
+            "read_count": counters.read_count,
+            "write_count": counters.write_count,
+        }
+
+@register_collector
+class NetIOCollector(MetricCollector):
+    name = "net_io"
+    interval = 5
+    counter = True
+
+    def read(self):
+        counters = psutil.net_io_counters()
+        return {
+            "bytes_sent": counters.bytes_sent,
+            "bytes_recv": counters.bytes_recv,
+            "packets_sent": counters.packets_sent,
+            "packets_recv": counters.packets_recv,
+        }
+
+@register_collector
+class DisksCollector(MetricCollector):
+    name = "disks"
+    interval = 60
+
+    def read(self):
+        values = {}
+        for partition in psutil.disk_partitions(all=False):
+            try:
+                usage = psutil.disk_usage(partition.mountpoint)
+            except (PermissionError, OSError):
+                continue
+            values[f"{partition.mountpoint}.free"] = usage.free
+            values[f"{partition.mountpoint}.total"] = usage.total
+        return values
+
+# Поток дополнительных сборщиков данных: у каждого сборщика свой интервал,
+# поэтому медленные сборщики не задерживают основной поток опроса. Результат
+# каждого сбора передается в sink(rows, table)
+class CollectorRunner(threading.Thread):
+    def __init__(self, collectors, sink):
+        super().__init__(daemon=True)
+        self.collectors = collectors
+        self.sink = sink
+        self.stop_event = threading.Event()
+        self.scheduler = DeadlineScheduler(min(collector.interval for collector in collectors))
+
+    def run(self):
+        # Базовые значения сборщиков (в том числе percpu в psutil, которые хранятся
+        # для каждого потока) заново набираются в этом потоке
+        for collector in self.collectors:
+            collector.reset()
+        due = [time.monotonic()] * len(self.collectors)
+        while self.scheduler.wait(self.stop_event):
+            now = time.monotonic()
+            for index, collector in enumerate(self.collectors):
+                if now < due[index]:
+                    continue
+                due[index] = now + collector.interval
+                timing = diagnostics.enabled
+                if timing:
+                    started = time.perf_counter()
+                try:
+                    rows = collector.collect(now_ms())
+                except Exception as e:
+                    print(f"Ошибка сбора данных: {e}")
+                    continue
+                if timing:
+                    diagnostics.record(f"collect.{type(collector).__name__}", time.perf_counter() - started)
+                if rows:
+                    self.sink(rows, collector.table)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+# Сборщики по именам из реестра; intervals переопределяет интервалы по имени
+def make_collectors(names, intervals=None):
+    intervals = intervals or {}
+    unknown = [name for name in names if name not in COLLECTORS]
+    if unknown:
+        raise ValueError(f"Неизвестные сборщики: {', '.join(unknown)}")
+    return [COLLECTORS[name](intervals.get(name)) for name in names]
+
+# Сборщики, включенные настройками
+def default_collectors():
+    collectors = make_collectors(ENABLED_COLLECTORS)
+    if PROCESS_TOP_N:
+        collectors.append(ProcessCollector(PROCESS_TOP_N, PROCESS_INTERVAL))
+    return collectors
+
+# Значения метрик для оповещений: загрузка ЦП и занятые ОЗУ и ПЗУ в
+# процентах, свободные ОЗУ и ПЗУ в ГБ
+ALERT_METRICS = {
+    "cpu_usage": lambda sample: sample.cpu_usage,
+    "memory_used": lambda sample: (
+        100 * (1 - sample.memory_available / sample.memory_total) if sample.memory_total else 0.0
+    ),
+    "disk_used": lambda sample: 100 * (1 - sample.disk_free / sample.disk_total) if sample.disk_total else 0.0,
+    "memory_available": lambda sample: sample.memory_available / 1024 ** 3,
+    "disk_free": lambda sample: sample.disk_free / 1024 ** 3,
+}
+ALERT_AGGREGATES = ("min", "max", "avg")
+ALERT_OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+AlertRule = namedtuple("AlertRule", "name metric aggregate op threshold window")
+
+# Правило оповещения с проверкой метрики, показателя и сравнения
+def make_rule(name, metric, aggregate, op, threshold, window=0):
+    if metric not in ALERT_METRICS:
+        raise ValueError(f"Неизвестная метрика оповещения: {metric}")
+    if aggregate not in ALERT_AGGREGATES:
+        raise ValueError(f"Неизвестный показатель окна: {aggregate}")
+    if op not in ALERT_OPERATORS:
+        raise ValueError(f"Неизвестное сравнение: {op}")
+    if window < 0:
+        raise ValueError(f"Отрицательная длительность окна: {window}")
+    return AlertRule(name, metric, aggregate, op, float(threshold), float(window))
+
+# Переход правила в состояние "raised" (условие выполнилось) или "cleared"
+# (перестало выполняться) со значением показателя окна в этот момент
+Alert = namedtuple("Alert", "timestamp rule state value")
+
+# Строка таблицы alerts для оповещения
+def alert_row(alert):
+    return alert.timestamp, alert.rule.name, alert.state, alert.value
+
+# Скользящее окно последних duration миллисекунд значений одной метрики.
+# Сумма поддерживается нарастающим итогом, минимум и максимум — монотонными
+# очередями, поэтому добавление значения и все показатели стоят O(1) в среднем
+class SlidingWindow:
+    def __init__(self, duration):
+        self.duration = duration
+        self.values = deque()
+        self.minimums = deque()
+        self.maximums = deque()
+        self.total = 0.0
+        self.pushed = 0
+        self.start = None
+        self.last = None
+
+    def push(self, timestamp, value):
+        # После перерыва длиннее окна оно заполняется заново
+        if self.last is None or timestamp - self.last > self.duration:
+            self.start = timestamp
+        self.last = timestamp
+        index = self.pushed
+        self.pushed += 1
+        self.values.append((timestamp, value))
+        self.total += value
+        while self.minimums and self.minimums[-1][1] >= value:
+            self.minimums.pop()
+        self.minimums.append((index, value))
+        while self.maximums and self.maximums[-1][1] <= value:
+            self.maximums.pop()
+        self.maximums.append((index, value))
+
+        first = self.pushed - len(self.values)
+        while self.values[0][0] < timestamp - self.duration:
+            self.total -= self.values.popleft()[1]
+            if self.minimums[0][0] == first:
+                self.minimums.popleft()
+            if self.maximums[0][0] == first:
+                self.maximums.popleft()
+            first += 1
+
+    # Окно охватывает всю длительность, а не только начало записи
+    @property
+    def full(self):
+        return self.start is not None and self.last - self.start >= self.duration
+
+    def min(self):
+        return self.minimums[0][1]
+
+    def max(self):
+        return self.maximums[0][1]
+
+    def avg(self):
+        return self.total / len(self.values)
+
+# Проверка правил оповещений по снимкам потока опроса. Снимки лишь ставятся
+# в очередь, а правила проверяются в отдельном потоке, поэтому их число не
+# влияет на опрос. Правила с одинаковыми метрикой и окном делят одно окно,
+# и на каждом такте каждое окно и каждое правило обрабатываются за O(1)
+class AlertEngine(threading.Thread):
+    _STOP = object()
+
+    def __init__(self, rules):
+        super().__init__(daemon=True)
+        self.rules = rules
+        self.queue = Queue()
+        self.subscribers = []
+        self.lock = threading.Lock()
+        windows = {}
+        for rule in rules:
+            windows.setdefault((rule.metric, rule.window), SlidingWindow(rule.window * 1000))
+        self.windows = {}
+        for (metric, _), window in windows.items():
+            self.windows.setdefault(metric, []).append(window)
+        self.checks = [
+            (rule, windows[rule.metric, rule.window], getattr(windows[rule.metric, rule.window], rule.aggregate),
+             ALERT_OPERATORS[rule.op])
+            for rule in rules
+        ]
+        self.active = [False] * len(rules)
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.subscribers = self.subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        # Дожидается окончания текущей рассылки, после выхода callback больше не вызывается
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if s != callback]
+
+    # Подписчик потока опроса
+    def put(self, sample):
+        self.queue.put(sample)
+
+    def run(self):
+        while True:
+            sample = self.queue.get()
+            if sample is self._STOP:
+                break
+            timing = diagnostics.enabled
+            if timing:
+                diagnostics.gauge("alert_queue", self.queue.qsize())
+                started = time.perf_counter()
+            try:
+                self.publish(self.evaluate(sample))
+            except Exception as e:
+                print(f"Ошибка проверки оповещений: {e}")
+            if timing:
+                diagnostics.record("alerts", time.perf_counter() - started)
+
+    # Оповещения о правилах, сменивших состояние на этом снимке
+    def evaluate(self, sample):
+        # Окна идут по монотонным часам: перевод системных часов не должен ни
+        # сбрасывать окно, ни растягивать его. Время на стене остается в Alert
+        now = sample.monotonic * 1000
+        for metric, windows in self.windows.items():
+            value = ALERT_METRICS[metric](sample)
+            for window in windows:
+                window.push(now, value)
+        alerts = []
+        for index, (rule, window, aggregate, compare) in enumerate(self.checks):
+            if not window.full:
+                continue
+            value = aggregate()
+            firing = compare(value, rule.threshold)
+            if firing != self.active[index]:
+                self.active[index] = firing
+                alerts.append(Alert(sample.timestamp, rule, "raised" if firing else "cleared", value))
+        return alerts
+
+    def publish(self, alerts):
+        if not alerts:
+            return
+        with self.lock:
+            for callback in self.subscribers:
+                for alert in alerts:
+                    try:
+                        callback(alert)
+                    except Exception as e:
+                        print(f"Ошибка обработки оповещения: {e}")
+
+    def stop(self):
+        if self.is_alive():
+            self.queue.put(self._STOP)
+            self.join()
+
+# Правила оповещений из настроек
+def default_rules():
+    return [make_rule(*rule) for rule in ALERT_RULES]
+
+# Запись снимков потока опроса в базу данных, которую можно запускать
+# и останавливать многократно. Используется и окном, и фоновым регистратором.
+# Если передан alerts (AlertEngine), во время записи журналируются и оповещения
+class Recorder:
+    def __init__(self, sampler, db_name=DB_NAME, collectors=None, alerts=None, **writer_options):
+        self.sampler = sampler
+        self.db_name = db_name
+        self.collectors = default_collectors() if collectors is None else collectors
+        self.alerts = alerts
+        self.writer_options = writer_options
+        self.writer = None
+        self.runners = []
+
+    @property
+    def recording(self):
+        return self.writer is not None
+
+    def start(self):
+        if self.writer is None:
+            self.writer = BatchWriter(self.db_name, **self.writer_options)
+            self.writer.start()
+            self.sampler.subscribe(self.record_sample)
+            if self.alerts is not None:
+                self.alerts.subscribe(self.record_alert)
+            # Сборщики с одинаковым интервалом делят один поток
+            groups = {}
+            for collector in self.collectors:
+                groups.setdefault(collector.interval, []).append(collector)
+            self.runners = [CollectorRunner(group, self.writer.put_many) for group in groups.values()]
+            for runner in self.runners:
+                runner.start()
+
+    def stop(self):
+        if self.writer is not None:
+            for runner in self.runners:
+                runner.stop()
+            self.runners = []
+            self.sampler.unsubscribe(self.record_sample)
+            if self.alerts is not None:
+                self.alerts.unsubscribe(self.record_alert)
+            # Сброс буфера записи перед остановкой
+            self.writer.close()
+            self.writer = None
+
+    def record_sample(self, sample):
+        self.writer.put(sample_row(sample))
+
+    def record_alert(self, alert):
+        self.writer.put(alert_row(alert), "alerts")
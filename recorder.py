@@ -0,0 +1,158 @@
+import argparse
+import re
+import signal
+import time
+from queue import SimpleQueue, Empty
+
+from monitor import (
+    DB_NAME, SAMPLE_INTERVAL, MIN_SAMPLE_INTERVAL, BATCH_SIZE, FLUSH_INTERVAL, DB_SYNCHRONOUS,
+    SYNCHRONOUS_MODES, PROCESS_TOP_N, PROCESS_INTERVAL, ENABLED_COLLECTORS, COLLECTORS, create_db, make_collectors,
+    make_rule, default_rules, Sampler, Recorder, ProcessCollector, AlertEngine, diagnostics,
+)
+
+
+# Значение NAME=SECONDS параметра --collector-interval
+def collector_interval(value):
+    name, _, seconds = value.partition("=")
+    try:
+        return name, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается ИМЯ=СЕКУНДЫ: {value}")
+
+
+# Значение METRIC:AGGREGATE<OP>THRESHOLD[:WINDOW] параметра --alert,
+# например cpu_usage:min>90:60 — загрузка ЦП выше 90% в течение 60 с
+def alert_rule(value):
+    match = re.fullmatch(r"(\w+):(\w+)(>=|<=|>|<)([\d.]+)(?::([\d.]+))?", value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"ожидается МЕТРИКА:ПОКАЗАТЕЛЬ>ПОРОГ[:СЕКУНДЫ]: {value}")
+    metric, aggregate, op, threshold, window = match.groups()
+    try:
+        return make_rule(value, metric, aggregate, op, float(threshold), float(window or 0))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+# Фоновый регистратор без графического интерфейса:
+#   python -m recorder --db system_data.db --interval 1
+# SIGINT/SIGTERM — сброс буфера и выход, SIGUSR1 — начать запись, SIGUSR2 — приостановить
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="recorder", description="Запись загруженности ПК без интерфейса")
+    parser.add_argument("--db", default=DB_NAME, help="путь к базе данных")
+    parser.add_argument("--interval", type=float, default=SAMPLE_INTERVAL, help="интервал опроса в секундах")
+    parser.add_argument("--backoff", action="store_true", help="увеличивать интервал опроса при перегрузке")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="записей в одной транзакции")
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL, help="задержка сброса буфера в секундах")
+    parser.add_argument("--synchronous", default=DB_SYNCHRONOUS, choices=SYNCHRONOUS_MODES, help="режим PRAGMA synchronous")
+    parser.add_argument("--top-processes", type=int, default=PROCESS_TOP_N,
+                        help="сколько самых нагруженных процессов записывать, 0 — не записывать")
+    parser.add_argument("--process-interval", type=float, default=PROCESS_INTERVAL,
+                        help="интервал опроса процессов в секундах")
+    parser.add_argument("--collectors", default=",".join(ENABLED_COLLECTORS),
+                        help=f"сборщики метрик через запятую, доступны: {', '.join(COLLECTORS)}")
+    parser.add_argument("--collector-interval", type=collector_interval, action="append", default=[],
+                        metavar="ИМЯ=СЕКУНДЫ", help="интервал опроса отдельного сборщика")
+    parser.add_argument("--alert", type=alert_rule, action="append", default=[],
+                        metavar="МЕТРИКА:ПОКАЗАТЕЛЬ>ПОРОГ[:СЕКУНДЫ]",
+                        help="правило оповещения; если задано, заменяет правила из настроек")
+    parser.add_argument("--diagnostics", metavar="ФАЙЛ",
+                        help="включить самодиагностику и сохранить ее в JSON при выходе")
+    parser.add_argument("--paused", action="store_true", help="не начинать запись до сигнала SIGUSR1")
+    args = parser.parse_args(argv)
+    if args.interval < MIN_SAMPLE_INTERVAL:
+        parser.error(f"интервал опроса меньше {MIN_SAMPLE_INTERVAL} с: {args.interval}")
+    unknown = [name for name in args.collectors.split(",") if name and name not in COLLECTORS]
+    if unknown:
+        parser.error(f"неизвестные сборщики: {', '.join(unknown)}")
+    return args
+
+
+def print_alert(alert):
+    moment = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(alert.timestamp / 1000))
+    state = "сработало" if alert.state == "raised" else "снято"
+    print(f"{moment} Оповещение {state}: {alert.rule.name} ({alert.value:.2f})")
+
+
+# Обработчики сигналов только ставят команду в очередь, выполняет ее основной цикл.
+# Очередь — SimpleQueue: ее put можно вызывать из обработчика сигнала, прервавшего get
+def install_signal_handlers(commands):
+    handlers = {
+        "SIGINT": "exit",
+        "SIGTERM": "exit",
+        "SIGUSR1": "start",
+        "SIGUSR2": "stop",
+    }
+    for name, command in handlers.items():
+        # SIGUSR1 и SIGUSR2 отсутствуют в Windows
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda signum, frame, command=command: commands.put(command))
+
+
+def run(args, commands):
+    create_db(args.db)
+    if args.diagnostics:
+        diagnostics.enable()
+    sampler = Sampler(args.interval, args.backoff)
+    scheduler = sampler.scheduler
+    reported = (0, scheduler.interval)
+    names = [name for name in args.collectors.split(",") if name]
+    collectors = make_collectors(names, dict(args.collector_interval))
+    if args.top_processes:
+        collectors.append(ProcessCollector(args.top_processes, args.process_interval))
+    alerts = AlertEngine(args.alert or default_rules())
+    alerts.subscribe(print_alert)
+    sampler.subscribe(alerts.put)
+    recorder = Recorder(
+        sampler,
+        args.db,
+        collectors,
+        alerts,
+        batch_size=args.batch_size,
+        flush_interval=args.flush_interval,
+        synchronous=args.synchronous,
+    )
+    alerts.start()
+    sampler.start()
+    if not args.paused:
+        recorder.start()
+    print(f"Регистратор запущен: {args.db}, интервал {args.interval} с")
+
+    try:
+        while True:
+            try:
+                # Ожидание с таймаутом, чтобы сигналы обрабатывались и в Windows
+                command = commands.get(timeout=1)
+            except Empty:
+                # Сообщение о пропущенных тактах и изменении интервала опроса
+                state = (scheduler.missed, scheduler.interval)
+                if state != reported:
+                    print(f"Пропущено тактов: {scheduler.missed}, интервал опроса {scheduler.interval} с")
+                    reported = state
+                continue
+            if command == "exit":
+                break
+            if command == "start" and not recorder.recording:
+                recorder.start()
+                print("Запись начата")
+            elif command == "stop" and recorder.recording:
+                recorder.stop()
+                print("Запись приостановлена")
+    finally:
+        recorder.stop()
+        sampler.stop()
+        alerts.stop()
+        if args.diagnostics:
+            diagnostics.dump(args.diagnostics)
+            print(f"Самодиагностика сохранена: {args.diagnostics}")
+        print("Регистратор остановлен")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    commands = SimpleQueue()
+    install_signal_handlers(commands)
+    run(args, commands)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import unittest
+import sqlite3
+import os
+from bench import generate_data, bench_queries, bench_history_open, compare, parse_rows
+
+
+class TestBench(unittest.TestCase):
+    DB_NAME = "test_bench.db"
+
+    def tearDown(self):
+        """Удаляет синтетическую базу данных после каждого теста."""
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.DB_NAME + suffix):
+                os.remove(self.DB_NAME + suffix)
+
+    def test_generate_data(self):
+        """Тестирует генерацию синтетических записей вместе с агрегатами."""
+        start, end = generate_data(self.DB_NAME, 7200, end=1737128096000)
+        with sqlite3.connect(self.DB_NAME) as conn:
+            count, first, last = conn.execute("SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM system_data").fetchone()
+            hours = conn.execute("SELECT SUM(samples) FROM system_data_1h").fetchone()[0]
+        self.assertEqual(count, 7200)
+        self.assertEqual((first, last), (start, end - 1000))
+        self.assertEqual(hours, 7200, "Агрегаты должны учитывать все записи")
+
+    def test_queries_and_history_open(self):
+        """Тестирует замеры запросов и открытия истории на небольшой таблице."""
+        start, end = generate_data(self.DB_NAME, 2 * 60 * 60)
+        queries = bench_queries(self.DB_NAME, start, end, repeats=3)
+        history = bench_history_open(self.DB_NAME, repeats=2)
+        self.assertEqual(set(queries), {"page_1h", "stats_1h"}, "Диапазон длиннее таблицы должен пропускаться")
+        self.assertGreater(history["max_ms"], 0)
+
+    def test_compare_detects_regressions(self):
+        """Тестирует поиск ухудшений относительно прошлого прогона."""
+        previous = {"insert": {"rows": 100, "rows_per_s": 1000.0}, "tables": {"10000": {"page_ms": 1.0, "db_bytes": 100}}}
+        current = {"insert": {"rows": 200, "rows_per_s": 700.0}, "tables": {"10000": {"page_ms": 1.1, "db_bytes": 150}}}
+        regressions = [name for name, *_ in compare(current, previous, threshold=0.2)]
+        self.assertEqual(regressions, ["insert.rows_per_s", "tables.10000.db_bytes"])
+        self.assertEqual([parse_rows(value) for value in ("10k", "1.5M", "500")], [10000, 1500000, 500])
+
+
+if __name__ == "__main__":
+    unittest.main()
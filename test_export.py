@@ -0,0 +1,108 @@
+import unittest
+import sqlite3
+import os
+import io
+import csv
+import json
+from unittest.mock import patch
+from monitor import create_db, INSERT_SQL
+from export import export_csv, export_jsonl, export_file, write_archive, archive_samples, delete_samples, Archive, EXPORT_COLUMNS
+
+
+class TestExport(unittest.TestCase):
+    DB_NAME = "test_export.db"
+    ARCHIVE_NAME = "test_export.tzarch"
+    START = 1737128096000
+
+    def setUp(self):
+        """Создает тестовую базу данных с записями за 25 секунд."""
+        create_db(self.DB_NAME)
+        self.rows = [
+            (self.START + i * 1000, i + 0.25, 4 * 1024 ** 3 - i * 4096, 8 * 1024 ** 3, 50 * 1024 ** 3 - i, 100 * 1024 ** 3)
+            for i in range(25)
+        ]
+        with sqlite3.connect(self.DB_NAME) as conn:
+            conn.executemany(INSERT_SQL["system_data"], self.rows)
+
+    def tearDown(self):
+        """Удаляет тестовую базу данных и файлы выгрузки."""
+        for name in (self.DB_NAME, self.DB_NAME + "-wal", self.DB_NAME + "-shm", self.ARCHIVE_NAME, "test_export.csv"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def test_export_csv_and_jsonl(self):
+        """Тестирует потоковую выгрузку диапазона в CSV и JSON Lines."""
+        with sqlite3.connect(self.DB_NAME) as conn:
+            csv_file, jsonl_file = io.StringIO(), io.StringIO()
+            csv_count = export_csv(conn, csv_file, self.START + 5000, self.START + 15000, chunk_size=3)
+            jsonl_count = export_jsonl(conn, jsonl_file, self.START + 5000, self.START + 15000, chunk_size=3)
+
+        csv_rows = list(csv.reader(io.StringIO(csv_file.getvalue())))
+        jsonl_rows = [json.loads(line) for line in jsonl_file.getvalue().splitlines()]
+        self.assertEqual(csv_count, 10)
+        self.assertEqual(jsonl_count, 10)
+        self.assertEqual(tuple(csv_rows[0]), EXPORT_COLUMNS, "Неверный заголовок CSV")
+        self.assertEqual([float(row[2]) for row in csv_rows[1:]], [i + 0.25 for i in range(5, 15)])
+        self.assertEqual(jsonl_rows[0]["timestamp"], self.START + 5000)
+        self.assertEqual(jsonl_rows[-1]["disk_free"], 50 * 1024 ** 3 - 14)
+
+    def test_export_file_unknown_format(self):
+        """Тестирует отказ выгрузки в файл неизвестного формата."""
+        with self.assertRaises(ValueError):
+            export_file(self.DB_NAME, "test_export.xml")
+        self.assertEqual(export_file(self.DB_NAME, "test_export.csv"), 25)
+
+    def test_archive_roundtrip(self):
+        """Тестирует запись архива сегментами и чтение столбцов и строк по диапазону."""
+        with sqlite3.connect(self.DB_NAME) as conn:
+            count = write_archive(conn, self.ARCHIVE_NAME, segment_rows=10)
+
+        with Archive(self.ARCHIVE_NAME) as archive:
+            self.assertEqual(count, 25)
+            self.assertEqual(len(archive), 25)
+            self.assertEqual(len(archive.segments), 3, "Неверное число сегментов")
+            self.assertEqual((archive.t0, archive.t1), (self.rows[0][0], self.rows[-1][0]))
+            self.assertEqual(list(archive.rows()), self.rows, "Строки архива не совпадают с базой")
+            in_range = list(archive.rows(self.START + 8000, self.START + 12000))
+            cpu = [value for chunk in archive.column("cpu_usage", self.START + 20000) for value in chunk]
+        self.assertEqual(in_range, self.rows[8:12])
+        self.assertEqual(cpu, [i + 0.25 for i in range(20, 25)])
+
+    def test_delete_archived_samples(self):
+        """Тестирует удаление заархивированных записей порциями."""
+        with sqlite3.connect(self.DB_NAME) as conn:
+            deleted = delete_samples(conn, t1=self.START + 20000, batch=7)
+            remaining = conn.execute("SELECT COUNT(*) FROM system_data").fetchone()[0]
+        self.assertEqual(deleted, 20)
+        self.assertEqual(remaining, 5)
+
+    def test_archive_samples_deletes_only_archived(self):
+        """Тестирует удаление ровно тех записей, что попали в архив."""
+        with sqlite3.connect(self.DB_NAME) as conn:
+            count, deleted = archive_samples(conn, self.ARCHIVE_NAME, t0=self.START + 10000, segment_rows=10)
+            remaining = [row[0] for row in conn.execute("SELECT timestamp FROM system_data ORDER BY timestamp")]
+            self.assertFalse(conn.in_transaction, "Транзакция архивации не завершена")
+        with Archive(self.ARCHIVE_NAME) as archive:
+            self.assertEqual((count, deleted, len(archive)), (15, 15, 15))
+        self.assertEqual(remaining, [row[0] for row in self.rows[:10]])
+
+    def test_archive_samples_keeps_rows_written_meanwhile(self):
+        """Тестирует, что записи, сделанные во время архивации, не удаляются."""
+        late = (self.START + 60000, 1.0, 1, 2, 3, 4)
+
+        def write_and_record(conn, *args):
+            count = write_archive(conn, *args)
+            # Регистратор дописывает снимок, пока архив уже записан
+            with sqlite3.connect(self.DB_NAME) as other:
+                other.execute(INSERT_SQL["system_data"], late)
+            return count
+
+        with sqlite3.connect(self.DB_NAME) as conn, patch("export.write_archive", write_and_record):
+            count, deleted = archive_samples(conn, self.ARCHIVE_NAME)
+            remaining = conn.execute("SELECT timestamp FROM system_data").fetchall()
+        self.assertEqual((count, deleted), (25, 25))
+        self.assertEqual(remaining, [(late[0],)], "Удалена запись, не попавшая в архив")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,625 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sqlite3
+import os
+import subprocess
+import sys
+import time
+import json
+import threading
+import psutil
+import recorder
+from monitor import (
+    create_db, migrate_db, get_system_data, BatchWriter, connect_db, samples_between, latest, pick_resolution,
+    now_ms, SCHEMA_VERSION, MIGRATIONS, Sampler, Sample, Recorder, RingBuffer, DeadlineScheduler,
+    ProcessCollector, MetricCollector, CollectorRunner, COLLECTORS, make_collectors, metric_between, metric_names, range_stats, stats_resolution,
+    SlidingWindow, AlertEngine, make_rule, LatencyHistogram, Diagnostics, STATS_MAX_POINTS,
+)
+
+
+class TestMonitor(unittest.TestCase):
+    DB_NAME = "test_system_data.db"
+
+    def setUp(self):
+        """Создает тестовую базу данных перед каждым тестом."""
+        self.db_name = TestMonitor.DB_NAME
+        create_db(self.db_name)
+
+    def tearDown(self):
+        """Удаляет тестовую базу данных после каждого теста."""
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def test_create_db(self):
+        """Тестирует создание базы данных."""
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='system_data';")
+            table = cursor.fetchone()
+        self.assertIsNotNone(table, "Таблица system_data не создана")
+
+    @patch('psutil.cpu_percent', return_value=50.0)
+    @patch('psutil.virtual_memory')
+    @patch('psutil.disk_usage')
+    def test_get_system_data(self, mock_disk, mock_memory, mock_cpu):
+        """Тестирует получение системных данных."""
+        mock_memory.return_value = MagicMock(available=8 * 1024 ** 3, total=16 * 1024 ** 3)
+        mock_disk.return_value = MagicMock(free=200 * 1024 ** 3, total=500 * 1024 ** 3)
+
+        cpu, memory, disk = get_system_data()
+
+        self.assertEqual(cpu, 50.0, "Некорректная загрузка ЦП")
+        self.assertEqual(memory.available, 8 * 1024 ** 3, "Некорректная доступная память")
+        self.assertEqual(disk.free, 200 * 1024 ** 3, "Некорректное свободное место на диске")
+
+    @patch('monitor.get_system_data')
+    def test_record_data(self, mock_get_data):
+        """Тестирует запись данных в базу данных."""
+        mock_get_data.return_value = (
+            50.0,
+            MagicMock(available=8 * 1024 ** 3, total=16 * 1024 ** 3),
+            MagicMock(free=200 * 1024 ** 3, total=500 * 1024 ** 3),
+        )
+
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            timestamp = int(time.time() * 1000)
+            cpu, memory, disk = get_system_data()
+            cursor.execute(
+                "INSERT INTO system_data (timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    timestamp,
+                    cpu,
+                    memory.available,
+                    memory.total,
+                    disk.free,
+                    disk.total,
+                ),
+            )
+            conn.commit()
+
+            data = samples_between(conn, timestamp, timestamp + 1)
+
+        self.assertEqual(len(data), 1, "Данные не записаны в базу данных")
+        self.assertEqual(
+            data[0][1], timestamp, "Время записи в базе данных не совпадает с ожидаемым"
+        )
+
+    def test_batch_writer_flush_on_close(self):
+        """Тестирует пакетную запись и сброс буфера при остановке."""
+        writer = BatchWriter(self.db_name, batch_size=100, flush_interval=60)
+        writer.start()
+        for i in range(10):
+            writer.put((now_ms() + i * 1000, float(i), 4 * 1024 ** 3, 8 * 1024 ** 3, 50 * 1024 ** 3, 100 * 1024 ** 3))
+        writer.close()
+
+        with sqlite3.connect(self.db_name) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM system_data").fetchone()[0]
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(count, 10, "Буфер не сброшен при остановке записи")
+        self.assertEqual(journal_mode, "wal", "База данных не переведена в режим WAL")
+
+    def test_batch_writer_retries_locked_db(self):
+        """Тестирует сохранение буфера, пока база заблокирована другим соединением."""
+        writer = BatchWriter(self.db_name, batch_size=1, flush_interval=60, timeout=0.05)
+        lock = sqlite3.connect(self.db_name)
+        lock.execute("PRAGMA journal_mode=WAL")
+        lock.execute("BEGIN IMMEDIATE")
+        writer.start()
+        with patch("monitor.WRITE_RETRY_INTERVAL", 0.05), patch("builtins.print") as mock_print:
+            for i in range(5):
+                writer.put((now_ms() + i * 1000, float(i), 4 * 1024 ** 3, 8 * 1024 ** 3, 50 * 1024 ** 3, 100 * 1024 ** 3))
+            time.sleep(0.3)
+            lock.rollback()
+            lock.close()
+            writer.close()
+
+        with sqlite3.connect(self.db_name) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM system_data").fetchone()[0]
+        self.assertTrue(mock_print.called, "Блокировка базы не проявилась")
+        self.assertEqual(count, 5, "Записи потеряны из-за блокировки базы")
+
+    def test_connect_db_invalid_synchronous(self):
+        """Тестирует проверку режима synchronous."""
+        with self.assertRaises(ValueError):
+            connect_db(self.db_name, synchronous="FAST")
+
+    def test_samples_between_and_latest(self):
+        """Тестирует выборку записей по диапазону времени и последних записей."""
+        start = 1737128096000
+        with sqlite3.connect(self.db_name) as conn:
+            conn.executemany(
+                "INSERT INTO system_data (timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total) VALUES (?, ?, ?, ?, ?, ?)",
+                [(start + i * 1000, float(i), 4 * 1024 ** 3, 8 * 1024 ** 3, 50 * 1024 ** 3, 100 * 1024 ** 3) for i in range(25)],
+            )
+            conn.commit()
+
+            in_range = samples_between(conn, start + 5000, start + 15000)
+            first_page = samples_between(conn, limit=10)
+            next_page = samples_between(conn, after=(first_page[-1][1], first_page[-1][0]), limit=10)
+            previous_page = samples_between(conn, before=(next_page[0][1], next_page[0][0]), limit=10)
+            last_rows = latest(conn, 3)
+
+        self.assertEqual([row[2] for row in in_range], [float(i) for i in range(5, 15)])
+        self.assertEqual([row[0] for row in first_page], list(range(1, 11)))
+        self.assertEqual([row[0] for row in next_page], list(range(11, 21)))
+        self.assertEqual(previous_page, first_page, "Предыдущая страница выбрана неверно")
+        self.assertEqual([row[0] for row in last_rows], [23, 24, 25])
+
+    def test_migrate_legacy_db(self):
+        """Тестирует обновление базы данных со старой схемой."""
+        os.remove(self.db_name)
+        with sqlite3.connect(self.db_name) as conn:
+            conn.executescript(MIGRATIONS[0])
+            conn.execute(
+                "INSERT INTO system_data (timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total) VALUES (?, ?, ?, ?, ?, ?)",
+                ("2025-01-17 15:34:56", 15.5, 4.0, 8.0, 50.5, 100.0),
+            )
+            conn.commit()
+
+        create_db(self.db_name)
+
+        with sqlite3.connect(self.db_name) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            row = conn.execute("SELECT * FROM system_data").fetchone()
+            indexes = [r[1] for r in conn.execute("PRAGMA index_list(system_data)")]
+        expected_timestamp = int(time.mktime(time.strptime("2025-01-17 15:34:56", "%Y-%m-%d %H:%M:%S"))) * 1000
+        self.assertEqual(version, SCHEMA_VERSION)
+        self.assertEqual(row, (1, expected_timestamp, 15.5, 4 * 1024 ** 3, 8 * 1024 ** 3, int(50.5 * 1024 ** 3), 100 * 1024 ** 3))
+        self.assertIn("idx_system_data_timestamp", indexes, "Индекс по времени не создан")
+
+    def test_migrate_concurrently(self):
+        """Тестирует одновременное обновление старой базы несколькими процессами."""
+        os.remove(self.db_name)
+        with sqlite3.connect(self.db_name) as conn:
+            conn.executescript(MIGRATIONS[0])
+            conn.execute(
+                "INSERT INTO system_data (timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total) VALUES (?, ?, ?, ?, ?, ?)",
+                ("2025-01-17 15:34:56", 15.5, 4.0, 8.0, 50.5, 100.0),
+            )
+            conn.commit()
+
+        # Интерфейс и регистратор, запущенные одновременно, обновляют базу из разных соединений
+        connections = [sqlite3.connect(self.db_name, timeout=30, check_same_thread=False) for _ in range(4)]
+        threads = [threading.Thread(target=migrate_db, args=(conn,)) for conn in connections]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for conn in connections:
+            conn.close()
+
+        with sqlite3.connect(self.db_name) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            row = conn.execute("SELECT memory_total FROM system_data").fetchone()
+        self.assertEqual(version, SCHEMA_VERSION)
+        self.assertEqual(row, (8 * 1024 ** 3,), "Миграция применена повторно")
+
+    def test_rollups_updated_incrementally(self):
+        """Тестирует пополнение таблиц агрегатов новыми записями."""
+        minute = 1737128040000
+        for values in ([10.0, 30.0], [50.0]):
+            writer = BatchWriter(self.db_name, retention={})
+            writer.start()
+            for cpu in values:
+                writer.put((minute + int(cpu) * 100, cpu, 4 * 1024 ** 3, 8 * 1024 ** 3, 50 * 1024 ** 3, 100 * 1024 ** 3))
+            writer.close()
+
+        with sqlite3.connect(self.db_name) as conn:
+            rollup = conn.execute(
+                "SELECT timestamp, samples, cpu_min, cpu_max, cpu_sum FROM system_data_1m"
+            ).fetchall()
+            averaged = samples_between(conn, table="system_data_1h")
+        self.assertEqual(rollup, [(minute, 3, 10.0, 50.0, 90.0)], "Агрегаты за минуту посчитаны неверно")
+        self.assertEqual(len(averaged), 1)
+        self.assertEqual(averaged[0][2], 30.0, "Среднее за час посчитано неверно")
+
+    def test_retention_prunes_in_batches(self):
+        """Тестирует удаление устаревших записей порциями."""
+        old = now_ms() - 2 * 24 * 60 * 60 * 1000
+        writer = BatchWriter(self.db_name, batch_size=5, retention={"system_data": 24 * 60 * 60}, prune_batch=4)
+        writer.start()
+        for i in range(10):
+            writer.put((old + i * 1000, 10.0, 4 * 1024 ** 3, 8 * 1024 ** 3, 50 * 1024 ** 3, 100 * 1024 ** 3))
+        writer.put((now_ms(), 10.0, 4 * 1024 ** 3, 8 * 1024 ** 3, 50 * 1024 ** 3, 100 * 1024 ** 3))
+        writer.close()
+
+        with sqlite3.connect(self.db_name) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM system_data").fetchone()[0]
+            rollup_samples = conn.execute("SELECT SUM(samples) FROM system_data_1h").fetchone()[0]
+        # Три прохода по 4 строки удаляют все 10 устаревших записей
+        self.assertEqual(count, 1, "Устаревшие записи не удалены")
+        self.assertEqual(rollup_samples, 11, "Очистка не должна затрагивать агрегаты")
+
+    def test_pick_resolution(self):
+        """Тестирует выбор разрешения истории по диапазону времени."""
+        now = now_ms()
+        self.assertEqual(pick_resolution(now - 60 * 60 * 1000), "system_data")
+        self.assertEqual(pick_resolution(now - 2 * 24 * 60 * 60 * 1000), "system_data_1m")
+        self.assertEqual(pick_resolution(now - 365 * 24 * 60 * 60 * 1000), "system_data_1h")
+        # Статистика за несколько суток считается по минутным агрегатам
+        self.assertEqual(pick_resolution(now - 24 * 60 * 60 * 1000, max_points=STATS_MAX_POINTS), "system_data")
+        self.assertEqual(pick_resolution(now - 3 * 24 * 60 * 60 * 1000, max_points=STATS_MAX_POINTS), "system_data_1m")
+        self.assertEqual(
+            pick_resolution(now - 60 * 60 * 1000, retention={"system_data": 60}), "system_data_1m",
+            "Удаленные политикой хранения записи не должны выбираться",
+        )
+
+    def test_range_stats(self):
+        """Тестирует статистику за диапазон по записям и по агрегатам."""
+        start = now_ms() - 200 * 1000
+        writer = BatchWriter(self.db_name, batch_size=1000)
+        writer.start()
+        for i in range(100):
+            writer.put((start + i * 1000, float(i + 1), 2 * 1024 ** 3, 8 * 1024 ** 3, 50 * 1024 ** 3, 100 * 1024 ** 3))
+        writer.close()
+
+        with sqlite3.connect(self.db_name) as conn:
+            count, stats = range_stats(conn, start, start + 100 * 1000)
+            rollup_count, rollup_stats = range_stats(conn, table="system_data_1h")
+            empty = range_stats(conn, start - 10000, start)
+            # Регистратор писал в 10 раз чаще, чем предполагает оценка по интервалу опроса
+            with patch("monitor.RESOLUTIONS", [("system_data", 10 * 1000), ("system_data_1m", 60 * 1000)]):
+                resolutions = [stats_resolution(conn, start, start + 100 * 1000, max_rows=rows) for rows in (100, 50)]
+
+        self.assertEqual(count, 100)
+        self.assertEqual(stats["cpu_usage"], (1.0, 100.0, 50.5, 95.0, 99.0))
+        self.assertEqual(stats["memory_used"].max, 75.0)
+        self.assertEqual(rollup_count, 100, "Число снимков в агрегатах должно учитывать samples")
+        self.assertEqual(rollup_stats["cpu_usage"][:3], (1.0, 100.0, 50.5))
+        self.assertEqual(empty, (0, {}))
+        self.assertEqual(resolutions, ["system_data", "system_data_1m"], "Таблица статистики выбрана без учета числа строк")
+
+
+    @patch('monitor.get_system_data')
+    def test_sampler_single_snapshot_per_tick(self, mock_get_data):
+        """Тестирует рассылку одного снимка всем подписчикам."""
+        mock_get_data.return_value = (
+            50.0,
+            MagicMock(available=8 * 1024 ** 3, total=16 * 1024 ** 3),
+            MagicMock(free=200 * 1024 ** 3, total=500 * 1024 ** 3),
+        )
+        sampler = Sampler()
+        first, second = [], []
+        sampler.subscribe(first.append)
+        sampler.subscribe(second.append)
+
+        sample = sampler.tick()
+        sampler.unsubscribe(second.append)
+        sampler.tick()
+
+        self.assertEqual(mock_get_data.call_count, 2, "psutil должен опрашиваться один раз за такт")
+        self.assertIsInstance(sample, Sample)
+        self.assertEqual(sample.memory_available, 8 * 1024 ** 3)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(second, [sample], "Отписанный подписчик получил данные")
+
+    @patch('monitor.get_system_data')
+    def test_recorder_start_stop(self, mock_get_data):
+        """Тестирует запуск и остановку записи снимков потока опроса."""
+        mock_get_data.return_value = (
+            50.0,
+            MagicMock(available=8 * 1024 ** 3, total=16 * 1024 ** 3),
+            MagicMock(free=200 * 1024 ** 3, total=500 * 1024 ** 3),
+        )
+        sampler = Sampler()
+        recorder = Recorder(sampler, self.db_name, collectors=[], flush_interval=60)
+
+        sampler.tick()
+        recorder.start()
+        self.assertTrue(recorder.recording)
+        sampler.tick()
+        sampler.tick()
+        recorder.stop()
+        sampler.tick()
+
+        self.assertFalse(recorder.recording)
+        with sqlite3.connect(self.db_name) as conn:
+            rows = latest(conn, 10)
+        self.assertEqual(len(rows), 2, "Записаны снимки вне интервала записи")
+        self.assertEqual(rows[0][3], 8 * 1024 ** 3)
+
+    def test_import_without_tkinter(self):
+        """Тестирует, что ядро импортируется без загрузки tkinter."""
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, monitor, recorder; print('tkinter' in sys.modules)"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        self.assertEqual(result.stdout.strip(), "False", "Импорт ядра загружает tkinter")
+
+
+    def test_ring_buffer_wraps_around(self):
+        """Тестирует вытеснение старых снимков из кольцевого буфера."""
+        buffer = RingBuffer(3)
+        for i in range(5):
+            buffer.append(Sample(i * 1000, float(i), float(i * 10), 16.0, 100.0, 200.0, 500.0))
+
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(list(buffer.column("cpu_usage")), [20.0, 30.0, 40.0], "Нарушен порядок значений")
+        self.assertEqual(buffer.column("timestamp").typecode, "d", "Буфер должен храниться в array")
+        self.assertEqual(buffer.last("monotonic"), 4.0)
+
+
+    @patch('monitor.time.monotonic')
+    def test_scheduler_keeps_grid(self, mock_monotonic):
+        """Тестирует отсутствие дрейфа тактов при длительной работе."""
+        scheduler = DeadlineScheduler(0.1)
+        mock_monotonic.return_value = 100.0
+        self.assertAlmostEqual(scheduler.advance(), 0.1)
+
+        # Работа такта заняла 30 мс: задержка сокращается, сетка не сдвигается
+        mock_monotonic.return_value = 100.13
+        self.assertAlmostEqual(scheduler.advance(), 0.07)
+        self.assertAlmostEqual(scheduler.deadline, 100.2)
+        self.assertEqual(scheduler.missed, 0)
+
+    @patch('monitor.time.monotonic')
+    def test_scheduler_skips_missed_ticks(self, mock_monotonic):
+        """Тестирует пропуск тактов вместо их накопления."""
+        scheduler = DeadlineScheduler(0.1)
+        mock_monotonic.return_value = 100.0
+        scheduler.advance()
+
+        mock_monotonic.return_value = 100.45
+        delay = scheduler.advance()
+
+        self.assertEqual(scheduler.missed, 2, "Пропущенные такты не учтены")
+        self.assertAlmostEqual(scheduler.deadline, 100.4)
+        self.assertEqual(delay, 0.0, "Опоздавший такт должен выполняться сразу")
+
+    @patch('monitor.time.monotonic')
+    def test_scheduler_backoff(self, mock_monotonic):
+        """Тестирует увеличение интервала при перегрузке и возврат к исходному."""
+        scheduler = DeadlineScheduler(0.1, backoff=True)
+        mock_monotonic.return_value = 100.0
+        scheduler.advance()
+
+        mock_monotonic.return_value = 100.5
+        scheduler.advance()
+        self.assertAlmostEqual(scheduler.interval, 0.2, msg="Интервал не увеличен при перегрузке")
+
+        for _ in range(200):
+            mock_monotonic.return_value = scheduler.deadline
+            scheduler.advance()
+        self.assertAlmostEqual(scheduler.interval, 0.1, msg="Интервал не вернулся к исходному")
+
+    def test_sampler_rejects_too_short_interval(self):
+        """Тестирует ограничение частоты опроса."""
+        with self.assertRaises(ValueError):
+            Sampler(0.001)
+        with patch("sys.stderr"), self.assertRaises(SystemExit):
+            recorder.parse_args(["--interval", "0.001"])
+
+
+    @patch('monitor.psutil.Process')
+    @patch('monitor.psutil.pids')
+    def test_process_collector_top_n(self, mock_pids, mock_process):
+        """Тестирует выбор самых нагруженных процессов и замену Process при повторном использовании PID."""
+        stats = {
+            1: ("idle", 0.0, 10),
+            2: ("busy", 90.0, 20),
+            3: ("big", 5.0, 5000),
+            4: ("mid", 40.0, 30),
+        }
+
+        def make_process(pid):
+            process = MagicMock(pid=pid)
+            process.as_dict.side_effect = lambda attrs, ad_value=None: {
+                "name": stats[pid][0],
+                "cpu_percent": stats[pid][1],
+                "memory_info": MagicMock(rss=stats[pid][2]),
+            }
+            return process
+
+        psutil.process_iter.cache_clear()
+        mock_process.side_effect = make_process
+        mock_pids.return_value = [1, 2, 3, 4]
+        collector = ProcessCollector(top_n=1)
+
+        first = collector.collect(1000)
+        rows = collector.collect(2000)
+
+        self.assertEqual(first, [], "Первый замер cpu_percent не должен записываться")
+        self.assertEqual(mock_process.call_count, 4, "Объекты Process должны создаваться один раз")
+        self.assertEqual(rows, [(2000, 2, "busy", 90.0, 20), (2000, 3, "big", 5.0, 5000)])
+
+        # PID 2 занят новым процессом: psutil отмечает такие PID, process_iter
+        # отбрасывает старый Process и на следующем проходе создает новый
+        psutil._pids_reused.add(2)
+        stats[2] = ("new", 99.0, 20)
+        rows = [collector.collect(3000), collector.collect(4000), collector.collect(5000)]
+        psutil.process_iter.cache_clear()
+        self.assertEqual(mock_process.call_count, 5)
+        self.assertNotIn(
+            2, [row[1] for row in rows[0] + rows[1]], "Новый процесс с тем же PID не должен попадать в замер"
+        )
+        self.assertIn((5000, 2, "new", 99.0, 20), rows[2])
+
+    def test_process_collector_keeps_process_objects(self):
+        """Тестирует, что на повторном замере Process создаются только для новых процессов."""
+        psutil.process_iter.cache_clear()
+        collector = ProcessCollector(top_n=3)
+        collector.collect(1000)
+        known = set(collector.processes)
+        with patch.object(psutil.Process, "__init__", autospec=True, side_effect=psutil.Process.__init__) as mock_init:
+            rows = collector.collect(2000)
+        new = set(collector.processes) - known
+        self.assertEqual(mock_init.call_count, len(new), "Process создаются заново для известных процессов")
+        self.assertTrue(rows, "Второй замер должен вернуть процессы")
+
+    def test_batch_writer_routes_tables(self):
+        """Тестирует запись строк разных таблиц одной транзакцией."""
+        writer = BatchWriter(self.db_name, flush_interval=60)
+        writer.start()
+        timestamp = now_ms()
+        writer.put((timestamp, 10.0, 4 * 1024 ** 3, 8 * 1024 ** 3, 50 * 1024 ** 3, 100 * 1024 ** 3))
+        writer.put_many([(timestamp, 1, "init", 0.5, 1024), (timestamp, 2, "python", 20.0, 2048)], "process_data")
+        writer.close()
+
+        with sqlite3.connect(self.db_name) as conn:
+            system_count = conn.execute("SELECT COUNT(*) FROM system_data").fetchone()[0]
+            processes = conn.execute("SELECT pid, name, cpu_usage, rss FROM process_data ORDER BY pid").fetchall()
+        self.assertEqual(system_count, 1)
+        self.assertEqual(processes, [(1, "init", 0.5, 1024), (2, "python", 20.0, 2048)])
+
+
+    @patch('monitor.time.monotonic')
+    def test_metric_collector_counter_rates(self, mock_monotonic):
+        """Тестирует запись счетчиков как скорости изменения."""
+        class FakeCounterCollector(MetricCollector):
+            name = "fake"
+            counter = True
+
+            def __init__(self, readings):
+                super().__init__()
+                self.readings = iter(readings)
+
+            def read(self):
+                return next(self.readings)
+
+        collector = FakeCounterCollector([{"bytes": 100}, {"bytes": 400}, {"bytes": 50}])
+        mock_monotonic.return_value = 10.0
+        self.assertEqual(collector.collect(1000), [], "Первый замер счетчика не дает скорости")
+        mock_monotonic.return_value = 12.0
+        self.assertEqual(collector.collect(3000), [(3000, "fake.bytes", 150.0)])
+        mock_monotonic.return_value = 14.0
+        self.assertEqual(collector.collect(5000), [], "Сброс счетчика не должен давать отрицательную скорость")
+
+        # После паузы записи скорость считается заново, а не по всей паузе
+        collector.readings = iter([{"bytes": 1000}, {"bytes": 1100}])
+        runner = CollectorRunner([collector], MagicMock())
+        runner.stop_event.set()
+        runner.run()
+        mock_monotonic.return_value = 100.0
+        self.assertEqual(collector.collect(91000), [], "Состояние счетчика не сброшено при запуске записи")
+        mock_monotonic.return_value = 101.0
+        self.assertEqual(collector.collect(92000), [(92000, "fake.bytes", 100.0)])
+
+    def test_collector_registry(self):
+        """Тестирует создание сборщиков из реестра с собственными интервалами."""
+        for name in ("cpu_cores", "disks", "disk_io", "net_io", "swap", "load_average"):
+            self.assertIn(name, COLLECTORS)
+        collectors = make_collectors(["swap", "disks"], {"disks": 120})
+        self.assertEqual([collector.interval for collector in collectors], [COLLECTORS["swap"].interval, 120])
+        with self.assertRaises(ValueError):
+            make_collectors(["unknown"])
+
+    def test_metric_data_long_format(self):
+        """Тестирует запись новых метрик без изменения схемы."""
+        writer = BatchWriter(self.db_name, flush_interval=60)
+        writer.start()
+        timestamp = now_ms()
+        writer.put_many([(timestamp, "swap.used", 1.0), (timestamp, "net_io.bytes_recv", 10.0)], "metric_data")
+        writer.put_many([(timestamp + 1000, "swap.used", 2.0)], "metric_data")
+        writer.close()
+
+        with sqlite3.connect(self.db_name) as conn:
+            names = metric_names(conn)
+            values = metric_between(conn, "swap.used", timestamp, timestamp + 2000)
+        self.assertEqual(names, ["net_io.bytes_recv", "swap.used"])
+        self.assertEqual(values, [(timestamp, 1.0), (timestamp + 1000, 2.0)])
+
+
+    def test_sliding_window(self):
+        """Тестирует минимум, максимум и среднее скользящего окна при вытеснении значений."""
+        window = SlidingWindow(3000)
+        for i, value in enumerate([5.0, 1.0, 4.0, 2.0, 3.0, 6.0]):
+            window.push(i * 1000, value)
+            if i == 2:
+                self.assertFalse(window.full, "Окно не должно считаться заполненным раньше длительности")
+
+        self.assertTrue(window.full)
+        self.assertEqual((window.min(), window.max(), window.avg()), (2.0, 6.0, 3.75))
+        window.push(10000, 7.0)
+        self.assertFalse(window.full, "После перерыва длиннее окна оно заполняется заново")
+        self.assertEqual((window.min(), window.max(), window.avg()), (7.0, 7.0, 7.0))
+
+    def test_alert_engine_raise_and_clear(self):
+        """Тестирует срабатывание и снятие оповещений и общие окна правил."""
+        rules = [
+            make_rule("ЦП", "cpu_usage", "min", ">", 90, 2),
+            make_rule("ЦП в среднем", "cpu_usage", "avg", ">", 50, 2),
+            make_rule("Диск", "disk_free", "max", "<", 10),
+        ]
+        engine = AlertEngine(rules)
+        states = []
+        # Системные часы переводятся назад на каждом снимке, окна идут по монотонным
+        for i, (cpu, disk_gb) in enumerate([(95, 50), (95, 50), (95, 5), (20, 5), (20, 50)]):
+            sample = Sample(1737128096000 - i * 60 * 60 * 1000, i, cpu, 4 * 1024 ** 3, 8 * 1024 ** 3, disk_gb * 1024 ** 3, 100 * 1024 ** 3)
+            alerts = engine.evaluate(sample)
+            states.append([(alert.rule.name, alert.state) for alert in alerts])
+
+        self.assertEqual(sum(len(windows) for windows in engine.windows.values()), 2, "Окна правил не объединены")
+        self.assertEqual(alerts[0].timestamp, sample.timestamp, "Время оповещения должно быть системным")
+        self.assertEqual(states, [
+            [],
+            [],
+            [("ЦП", "raised"), ("ЦП в среднем", "raised"), ("Диск", "raised")],
+            [("ЦП", "cleared")],
+            [("ЦП в среднем", "cleared"), ("Диск", "cleared")],
+        ])
+        with self.assertRaises(ValueError):
+            make_rule("Неизвестно", "gpu_usage", "max", ">", 1)
+
+    def test_recorder_logs_alerts(self):
+        """Тестирует журналирование оповещений во время записи."""
+        sampler = MagicMock()
+        engine = AlertEngine([make_rule("Диск", "disk_free", "max", "<", 10)])
+        recorder = Recorder(sampler, self.db_name, collectors=[], alerts=engine)
+        recorder.start()
+        engine.publish(engine.evaluate(Sample(now_ms(), 0, 1.0, 1, 2, 5 * 1024 ** 3, 10 * 1024 ** 3)))
+        recorder.stop()
+        engine.publish(engine.evaluate(Sample(now_ms(), 1, 1.0, 1, 2, 50 * 1024 ** 3, 100 * 1024 ** 3)))
+
+        with sqlite3.connect(self.db_name) as conn:
+            rows = conn.execute("SELECT rule, state, value FROM alerts").fetchall()
+        self.assertEqual(rows, [("Диск", "raised", 5.0)], "Оповещения вне записи не журналируются")
+
+
+    def test_latency_histogram(self):
+        """Тестирует запись длительностей и оценку перцентилей гистограммы."""
+        histogram = LatencyHistogram()
+        for _ in range(98):
+            histogram.record(0.0003)
+        histogram.record(0.005)
+        histogram.record(0.02)
+
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual(summary["p50_ms"], 0.512, "Перцентиль оценивается границей интервала")
+        self.assertEqual(summary["p99_ms"], 8.192)
+        self.assertAlmostEqual(summary["max_ms"], 20.0)
+
+    @patch('monitor.get_system_data')
+    def test_diagnostics_disabled_and_enabled(self, mock_get_data):
+        """Тестирует, что выключенная самодиагностика не замеряет, а включенная сохраняется в JSON."""
+        mock_get_data.return_value = (
+            50.0,
+            MagicMock(available=8 * 1024 ** 3, total=16 * 1024 ** 3),
+            MagicMock(free=200 * 1024 ** 3, total=500 * 1024 ** 3),
+        )
+        instance = Diagnostics(enabled=False)
+        with patch("monitor.diagnostics", instance):
+            Sampler().tick()
+            self.assertEqual(instance.histograms, {}, "Выключенная диагностика не должна замерять")
+            instance.enable()
+            Sampler().tick()
+            instance.gauge("writer_queue", 3)
+            instance.gauge("writer_queue", 1)
+
+        path = "test_diagnostics.json"
+        try:
+            instance.dump(path)
+            with open(path, encoding="utf-8") as fp:
+                snapshot = json.load(fp)
+        finally:
+            os.remove(path)
+        self.assertEqual(set(snapshot["latency"]), {"sample", "publish"})
+        self.assertEqual(snapshot["latency"]["sample"]["count"], 1)
+        self.assertEqual(snapshot["gauges"]["writer_queue"], {"value": 1, "max": 3})
+        self.assertGreater(snapshot["process"]["rss"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
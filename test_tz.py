@@ -1,11 +1,10 @@
 import unittest
 from unittest.mock import patch, MagicMock
-import sqlite3
 import os
-import time
 import tkinter as tk
 from tkinter import ttk
-from tz import create_db, get_system_data, SystemMonitorApp
+from monitor import Stats, Alert, make_rule, Diagnostics
+from tz import create_db, SystemMonitorApp, SparklineChart, StatsView
 
 
 class TestTreeview(ttk.Treeview):
@@ -40,86 +39,36 @@ class TestSystemMonitor(unittest.TestCase):
     def tearDown(self):
         """Удаляет тестовую базу данных после каждого теста."""
         self.app.stop_update()
+        self.app.sampler.stop()
+        self.app.alerts.stop()
         if os.path.exists(self.db_name):
             os.remove(self.db_name)
         self.root.destroy()
 
-    def test_create_db(self):
-        """Тестирует создание базы данных."""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='system_data';")
-            table = cursor.fetchone()
-        self.assertIsNotNone(table, "Таблица system_data не создана")
-
-    @patch('psutil.cpu_percent', return_value=50.0)
-    @patch('psutil.virtual_memory')
-    @patch('psutil.disk_usage')
-    def test_get_system_data(self, mock_disk, mock_memory, mock_cpu):
-        """Тестирует получение системных данных."""
-        mock_memory.return_value = MagicMock(available=8 * 1024 ** 3, total=16 * 1024 ** 3)
-        mock_disk.return_value = MagicMock(free=200 * 1024 ** 3, total=500 * 1024 ** 3)
-
-        cpu, memory, disk = get_system_data()
-
-        self.assertEqual(cpu, 50.0, "Некорректная загрузка ЦП")
-        self.assertEqual(memory.available, 8 * 1024 ** 3, "Некорректная доступная память")
-        self.assertEqual(disk.free, 200 * 1024 ** 3, "Некорректное свободное место на диске")
-
-    @patch('tz.get_system_data')
-    def test_record_data(self, mock_get_data):
-        """Тестирует запись данных в базу данных."""
-        mock_get_data.return_value = (
-            50.0,
-            MagicMock(available=8 * 1024 ** 3, total=16 * 1024 ** 3),
-            MagicMock(free=200 * 1024 ** 3, total=500 * 1024 ** 3),
-        )
-
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-            cpu, memory, disk = get_system_data()
-            cursor.execute(
-                "INSERT INTO system_data (timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total) VALUES (?, ?, ?, ?, ?, ?)",
-                (
-                    timestamp,
-                    cpu,
-                    memory.available / 1024 ** 3,
-                    memory.total / 1024 ** 3,
-                    disk.free / 1024 ** 3,
-                    disk.total / 1024 ** 3,
-                ),
-            )
-            conn.commit()
-
-            cursor.execute("SELECT * FROM system_data")
-            data = cursor.fetchall()
-
-        self.assertEqual(len(data), 1, "Данные не записаны в базу данных")
-        self.assertEqual(
-            data[0][1], timestamp, "Время записи в базе данных не совпадает с ожидаемым"
-        )
-
     @patch('tz.tk.Tk')
     def test_gui_initialization(self, mock_tk):
         """Тестирует инициализацию графического интерфейса."""
         mock_root = MagicMock()
         app = SystemMonitorApp(mock_root)
+        app.sampler.stop()
 
         self.assertIsNotNone(app.cpu_label, "Метка CPU не создана")
         self.assertIsNotNone(app.memory_label, "Метка памяти не создана")
         self.assertIsNotNone(app.disk_label, "Метка диска не создана")
 
+    @patch("tz.stats_resolution", return_value="system_data")
+    @patch("tz.range_stats", return_value=(0, {}))
+    @patch("tz.first_timestamp", return_value=1737128096000)
     @patch("sqlite3.connect")
-    def test_show_history_with_data(self, mock_connect):
+    def test_show_history_with_data(self, mock_connect, mock_first_timestamp, mock_range_stats, mock_stats_resolution):
         """Тестирует отображение истории в интерфейсе."""
         # Подготовка данных
         mock_cursor = MagicMock()
         mock_cursor.fetchall.return_value = [
-            (1, "2025-01-17 15:34:56", 15.5, 4.0, 8.0, 50.0, 100.0),
-            (2, "2025-01-17 15:35:56", 20.0, 3.5, 8.0, 48.0, 100.0),
+            (1, 1737128096000, 15.5, 4 * 1024 ** 3, 8 * 1024 ** 3, 50 * 1024 ** 3, 100 * 1024 ** 3),
+            (2, 1737128156000, 20.0, 3584 * 1024 ** 2, 8 * 1024 ** 3, 48 * 1024 ** 3, 100 * 1024 ** 3),
         ]
-        mock_connect.return_value.__enter__.return_value.cursor.return_value = mock_cursor
+        mock_connect.return_value.execute.return_value = mock_cursor
 
         # Замена Treeview для проверки вызовов
         with patch("tz.Treeview") as MockTreeview:
@@ -132,6 +81,11 @@ class TestSystemMonitor(unittest.TestCase):
             self.assertTrue(hasattr(self.app, "history_window"))
             self.assertTrue(mock_treeview.pack.called)
 
+            # Повторное нажатие поднимает открытое окно, а не создает второе
+            window = self.app.history_window
+            self.app.show_history()
+            self.assertIs(self.app.history_window, window, "Открыто второе окно истории")
+
             # Проверка вызовов метода insert
             actual_calls = mock_treeview.insert.call_args_list
             self.assertEqual(len(actual_calls), 2)
@@ -152,15 +106,17 @@ class TestSystemMonitor(unittest.TestCase):
                     actual_values[1], r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}"
                 )
 
-                # Проверка остальных значений
-                self.assertEqual(actual_values[2:], tuple(f"{v:.2f}" for v in expected_row[2:]))
+                # Проверка остальных значений: ЦП в процентах, память и диск в ГБ
+                self.assertEqual(actual_values[2], f"{expected_row[2]:.2f}")
+                self.assertEqual(actual_values[3:], tuple(f"{v / 1024 ** 3:.2f}" for v in expected_row[3:]))
 
+    @patch("tz.first_timestamp", return_value=None)
     @patch("sqlite3.connect")
-    def test_show_history_no_data(self, mock_connect):
+    def test_show_history_no_data(self, mock_connect, mock_first_timestamp):
         # Подготовка пустых данных
         mock_cursor = MagicMock()
         mock_cursor.fetchall.return_value = []
-        mock_connect.return_value.__enter__.return_value.cursor.return_value = mock_cursor
+        mock_connect.return_value.execute.return_value = mock_cursor
 
         # Проверка показа сообщения при отсутствии данных
         with patch("tkinter.messagebox.showinfo") as mock_messagebox:
@@ -168,5 +124,86 @@ class TestSystemMonitor(unittest.TestCase):
             mock_messagebox.assert_called_once_with("История", "Нет данных для отображения.")
 
 
+    def test_sparkline_chart_shifts_segments(self):
+        """Тестирует сдвиг графика без перерисовки существующих отрезков."""
+        chart = SparklineChart(self.root, capacity=5, width=40)
+        for value in range(3):
+            chart.push(value * 10)
+        first_segments = list(chart.segments)
+
+        for value in range(3, 10):
+            chart.push(value * 10)
+
+        self.assertEqual(len(chart.segments), 4, "Число отрезков должно быть ограничено емкостью")
+        self.assertEqual(len(chart.canvas.find_withtag("segment")), 4)
+        self.assertFalse(set(first_segments) & set(chart.segments), "Старые отрезки не удалены")
+        self.assertEqual(chart.canvas.coords(chart.segments[-1])[2], 40.0, "Новый отрезок должен быть справа")
+
+    @patch("tz.messagebox.showinfo")
+    @patch("tz.export_file", return_value=2)
+    @patch("tz.filedialog.asksaveasfilename", return_value="history.csv")
+    def test_export_history_in_background(self, mock_dialog, mock_export, mock_showinfo):
+        """Тестирует выгрузку истории в фоновом потоке с проверкой завершения через after."""
+        self.app.history_window = tk.Toplevel(self.root)
+        self.app.history = MagicMock(t0=1737128096000, t1=None, table="system_data")
+        self.app.export_button = tk.Button(self.app.history_window)
+
+        self.app.export_history()
+        self.assertEqual(str(self.app.export_button.cget("state")), tk.DISABLED)
+        while not mock_showinfo.called:
+            self.root.update()
+
+        mock_export.assert_called_once_with(self.db_name, "history.csv", 1737128096000, None, "system_data")
+        mock_showinfo.assert_called_once_with("Экспорт", "Выгружено записей: 2")
+        self.assertEqual(str(self.app.export_button.cget("state")), tk.NORMAL)
+
+    def test_stats_view_show(self):
+        """Тестирует вывод статистики за диапазон."""
+        view = StatsView(self.root)
+        view.show("system_data_1m", 120, {"cpu_usage": Stats(1.0, 99.5, 40.25, 90.0, None)})
+
+        self.assertEqual([cell.cget("text") for cell in view.cells["cpu_usage"]], ["1.00", "99.50", "40.25", "90.00", "—"])
+        self.assertEqual(view.cells["memory_used"][0].cget("text"), "—")
+        self.assertEqual(view.status_label.cget("text"), "Снимков: 120 (средние за минуту)")
+
+        view.show("system_data", 0, "Ошибка расчета статистики: нет доступа")
+        self.assertEqual(view.cells["cpu_usage"][0].cget("text"), "—", "Ошибка должна очищать таблицу")
+        self.assertEqual(view.status_label.cget("text"), "Ошибка расчета статистики: нет доступа")
+
+    def test_alerts_shown_until_cleared(self):
+        """Тестирует вывод сработавших оповещений и их снятие."""
+        rule = make_rule("Высокая загрузка ЦП", "cpu_usage", "min", ">", 90, 60)
+        self.app.alert_queue.put(Alert(1737128096000, rule, "raised", 95.5))
+        self.app.update_alerts()
+        self.assertIn("Высокая загрузка ЦП: 95.50", self.app.alert_label.cget("text"))
+
+        self.app.alert_queue.put(Alert(1737128156000, rule, "cleared", 40.0))
+        self.app.update_alerts()
+        self.assertEqual(self.app.alert_label.cget("text"), "", "Снятое оповещение должно исчезнуть")
+
+    def test_diagnostics_window(self):
+        """Тестирует окно самодиагностики: включение замеров и вывод задержек."""
+        with patch("tz.diagnostics", Diagnostics(enabled=False)) as instance:
+            self.app.show_diagnostics()
+            self.assertFalse(self.app.diagnostics_tree.get_children(), "Без замеров таблица должна быть пустой")
+
+            self.app.diagnostics_enabled.set(True)
+            self.app.toggle_diagnostics()
+            instance.record("ui_update", 0.002)
+            self.app.refresh_diagnostics()
+
+            rows = self.app.diagnostics_tree.get_children()
+            self.assertTrue(instance.enabled)
+            self.assertEqual([self.app.diagnostics_tree.item(row, "text") for row in rows], ["ui_update"])
+            self.assertIn("Процесс:", self.app.diagnostics_label.cget("text"))
+
+            # Повторное нажатие поднимает открытое окно, закрытие останавливает обновление
+            window = self.app.diagnostics_window
+            self.app.show_diagnostics()
+            self.assertIs(self.app.diagnostics_window, window, "Открыто второе окно самодиагностики")
+            self.app.close_diagnostics()
+            self.assertIsNone(self.app.diagnostics_task, "Обновление закрытого окна не отменено")
+
+
 if __name__ == "__main__":
     unittest.main()
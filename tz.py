@@ -1,68 +1,338 @@
-import os
-import psutil
 import time
 import sqlite3
-import tkinter as tk
-from tkinter import messagebox
 import threading
+import tkinter as tk
+from tkinter import messagebox, filedialog
+from collections import deque
 from queue import Queue
-from tkinter.ttk import Treeview
-
-
-# Настройки приложения
-UPDATE_INTERVAL = 1  # Интервал обновления в секундах
-DB_NAME = "system_data.db"
-
-# Создание базы данных и таблицы
-def create_db():
-    if not os.path.exists(DB_NAME):
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS system_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT,
-                    cpu_usage REAL,
-                    memory_available REAL,
-                    memory_total REAL,
-                    disk_free REAL,
-                    disk_total REAL
-                )
-                """
-            )
-            conn.commit()
+from tkinter.ttk import Treeview, Scrollbar, Combobox
+
+from monitor import (
+    DB_NAME, UPDATE_INTERVAL, SAMPLE_INTERVAL, STATS_MAX_POINTS, create_db, now_ms, samples_between,
+    first_timestamp, pick_resolution, range_stats, stats_resolution, default_rules, Sampler, Recorder, RingBuffer,
+    DeadlineScheduler, AlertEngine, diagnostics,
+)
+from export import export_file, parse_time, format_time
+
+
+# Настройки окна истории
+HISTORY_PAGE_SIZE = 200  # Число строк, подгружаемых за один запрос
+HISTORY_MAX_PAGES = 3  # Сколько страниц одновременно держится в Treeview
+HISTORY_RANGES = [
+    ("Последний час", 60 * 60),
+    ("Последние сутки", 24 * 60 * 60),
+    ("Последняя неделя", 7 * 24 * 60 * 60),
+    ("Последний месяц", 30 * 24 * 60 * 60),
+    ("Всё время", None),
+]
+RESOLUTION_NAMES = {
+    "system_data": "Все записи",
+    "system_data_1m": "Средние за минуту",
+    "system_data_1h": "Средние за час",
+}
+STATS_NAMES = {
+    "cpu_usage": "ЦП, %",
+    "memory_used": "ОЗУ занято, %",
+    "disk_used": "ПЗУ занято, %",
+}
+STATS_HEADINGS = ("Мин", "Макс", "Среднее", "p95", "p99")
+
+# Настройки окна самодиагностики
+DIAGNOSTICS_REFRESH = 1000  # Период обновления в миллисекундах
+DIAGNOSTICS_COLUMNS = ("count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+# Настройки графиков
+TREND_MINUTES = 10  # За сколько последних минут показываются графики
+CHART_WIDTH = 300
+CHART_HEIGHT = 50
+
+# Каждое stride-е значение, считая от последнего
+def downsample(values, stride):
+    return values[(len(values) - 1) % stride::stride] if values else values
+
+# Доля занятого объема в процентах
+def used_percent(available, total):
+    return 100 * (1 - available / total) if total else 0.0
+
+# Линейный график на Canvas: новый отрезок добавляется справа, а уже
+# нарисованные сдвигаются влево одним вызовом move, без перерисовки.
+# Полная перерисовка из source() выполняется только при изменении размера
+class SparklineChart:
+    def __init__(self, parent, capacity, source=None, width=CHART_WIDTH, height=CHART_HEIGHT,
+                 max_value=100.0, color="#2a7ab0"):
+        self.capacity = capacity
+        self.source = source
+        self.width = width
+        self.height = height
+        self.max_value = max_value
+        self.color = color
+        self.step = width / max(capacity - 1, 1)
+        self.segments = deque()
+        self.last_y = None
+
+        self.canvas = tk.Canvas(parent, width=width, height=height, bg="white", highlightthickness=0)
+        self.canvas.bind("<Configure>", self.on_resize)
+
+    def y(self, value):
+        value = min(max(value, 0.0), self.max_value)
+        return self.height - 1 - value / self.max_value * (self.height - 2)
+
+    def push(self, value):
+        y = self.y(value)
+        if self.last_y is not None:
+            self.canvas.move("segment", -self.step, 0)
+            self.segments.append(self.canvas.create_line(
+                self.width - self.step, self.last_y, self.width, y, fill=self.color, tags="segment"
+            ))
+            if len(self.segments) >= self.capacity:
+                self.canvas.delete(self.segments.popleft())
+        self.last_y = y
+
+    def redraw(self, values):
+        self.canvas.delete("segment")
+        self.segments.clear()
+        values = list(values)[-self.capacity:]
+        points = [(self.width - (len(values) - 1 - i) * self.step, self.y(value)) for i, value in enumerate(values)]
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            self.segments.append(self.canvas.create_line(x0, y0, x1, y1, fill=self.color, tags="segment"))
+        self.last_y = points[-1][1] if points else None
+
+    def on_resize(self, event):
+        if event.width == self.width and event.height == self.height:
+            return
+        self.width = event.width
+        self.height = event.height
+        self.step = self.width / max(self.capacity - 1, 1)
+        if self.source is not None:
+            self.redraw(self.source())
+
+# Таблица истории, в которой материализовано не более max_pages страниц:
+# при прокрутке к краю подгружается соседняя страница, а дальняя удаляется
+class HistoryView:
+    def __init__(self, parent, conn, rows, t0=None, t1=None, table="system_data",
+                 page_size=HISTORY_PAGE_SIZE, max_pages=HISTORY_MAX_PAGES):
+        self.conn = conn
+        self.t0 = t0
+        self.t1 = t1
+        self.table = table
+        self.page_size = page_size
+        self.max_rows = page_size * max_pages
+        self.loading = False
+        self.at_start = True
+        self.at_end = len(rows) < page_size
 
-# Получение данных о загрузке
-def get_system_data():
-    cpu_usage = psutil.cpu_percent(interval=None)
-    memory_usage = psutil.virtual_memory()
-    disk_usage = psutil.disk_usage('/')
-    return cpu_usage, memory_usage, disk_usage
+        self.tree = Treeview(
+            parent,
+            columns=("id", "timestamp", "cpu_usage", "memory_available", "memory_total", "disk_free", "disk_total"),
+            show="headings",
+        )
+
+        self.tree.heading("id", text="ID")
+        self.tree.heading("timestamp", text="Время записи")
+        self.tree.heading("cpu_usage", text="ЦП")
+        self.tree.heading("memory_available", text="ОЗУ (свободное)")
+        self.tree.heading("memory_total", text="ОЗУ (всего)")
+        self.tree.heading("disk_free", text="ПЗУ (свободное)")
+        self.tree.heading("disk_total", text="ПЗУ (всего)")
+
+        self.scrollbar = Scrollbar(parent, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+
+        self.first_key = self.row_key(rows[0]) if rows else None
+        self.last_key = self.row_key(rows[-1]) if rows else None
+        for row in rows:
+            self.tree.insert("", tk.END, iid=self.item_id(row), values=self.format_row(row))
+
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    # Ключ пагинации строки — (timestamp, id); он же зашит в идентификатор элемента Treeview
+    @staticmethod
+    def row_key(row):
+        return row[1], row[0]
+
+    @staticmethod
+    def item_id(row):
+        return f"{row[1]}:{row[0]}"
+
+    @staticmethod
+    def item_key(iid):
+        timestamp, row_id = iid.split(":")
+        return int(timestamp), int(row_id)
+
+    @staticmethod
+    def format_row(row):
+        return (
+            row[0],
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row[1] / 1000)),
+            f"{row[2]:.2f}",
+            f"{row[3] / 1024 ** 3:.2f}",
+            f"{row[4] / 1024 ** 3:.2f}",
+            f"{row[5] / 1024 ** 3:.2f}",
+            f"{row[6] / 1024 ** 3:.2f}",
+        )
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.loading:
+            return
+        # Подгрузка откладывается до простоя, чтобы не менять Treeview внутри его же колбэка
+        if float(last) > 0.9 and not self.at_end:
+            self.loading = True
+            self.tree.after_idle(self.load_next)
+        elif float(first) < 0.1 and not self.at_start:
+            self.loading = True
+            self.tree.after_idle(self.load_previous)
+
+    def top_index(self, count):
+        return round(float(self.tree.yview()[0]) * count)
+
+    def load_next(self):
+        timing = diagnostics.enabled
+        if timing:
+            started = time.perf_counter()
+        try:
+            rows = samples_between(self.conn, self.t0, self.t1, after=self.last_key, limit=self.page_size, table=self.table)
+            self.at_end = len(rows) < self.page_size
+            if not rows:
+                return
+            items = self.tree.get_children()
+            top = self.top_index(len(items))
+            for row in rows:
+                self.tree.insert("", tk.END, iid=self.item_id(row), values=self.format_row(row))
+            self.last_key = self.row_key(rows[-1])
+
+            overflow = len(items) + len(rows) - self.max_rows
+            if overflow > 0:
+                self.tree.delete(*items[:overflow])
+                self.first_key = self.item_key(self.tree.get_children()[0])
+                self.at_start = False
+                top -= overflow
+            count = len(items) + len(rows) - max(overflow, 0)
+            self.tree.yview_moveto(max(top, 0) / count)
+        finally:
+            self.loading = False
+            if timing:
+                diagnostics.record("history_page", time.perf_counter() - started)
+
+    def load_previous(self):
+        timing = diagnostics.enabled
+        if timing:
+            started = time.perf_counter()
+        try:
+            rows = samples_between(self.conn, self.t0, self.t1, before=self.first_key, limit=self.page_size, table=self.table)
+            self.at_start = len(rows) < self.page_size
+            if not rows:
+                return
+            items = self.tree.get_children()
+            top = self.top_index(len(items))
+            for row in reversed(rows):
+                self.tree.insert("", 0, iid=self.item_id(row), values=self.format_row(row))
+            self.first_key = self.row_key(rows[0])
+
+            overflow = len(items) + len(rows) - self.max_rows
+            if overflow > 0:
+                self.tree.delete(*items[len(items) - overflow:])
+                self.last_key = self.item_key(self.tree.get_children()[-1])
+                self.at_end = False
+            count = len(items) + len(rows) - max(overflow, 0)
+            self.tree.yview_moveto((top + len(rows)) / count)
+        finally:
+            self.loading = False
+            if timing:
+                diagnostics.record("history_page", time.perf_counter() - started)
+
+# Таблица статистики за диапазон: строка на метрику, столбец на показатель
+class StatsView:
+    def __init__(self, parent):
+        self.frame = tk.Frame(parent)
+        for column, heading in enumerate(STATS_HEADINGS, start=1):
+            tk.Label(self.frame, text=heading, width=10).grid(row=0, column=column)
+        self.cells = {}
+        for row, (metric, name) in enumerate(STATS_NAMES.items(), start=1):
+            tk.Label(self.frame, text=name, anchor="w").grid(row=row, column=0, sticky="w")
+            self.cells[metric] = [tk.Label(self.frame, text="—") for _ in STATS_HEADINGS]
+            for column, cell in enumerate(self.cells[metric], start=1):
+                cell.grid(row=row, column=column)
+        self.status_label = tk.Label(self.frame, anchor="w")
+        self.status_label.grid(row=len(STATS_NAMES) + 1, column=0, columnspan=len(STATS_HEADINGS) + 1, sticky="w")
+
+    def clear(self, status=""):
+        for cells in self.cells.values():
+            for cell in cells:
+                cell.config(text="—")
+        self.status_label.config(text=status)
+
+    # stats — словарь метрика -> Stats из range_stats или текст ошибки
+    def show(self, table, count, stats):
+        if isinstance(stats, str):
+            self.clear(stats)
+            return
+        self.clear(f"Снимков: {count}" + (f" ({RESOLUTION_NAMES[table].lower()})" if table != "system_data" else ""))
+        for metric, values in stats.items():
+            for cell, value in zip(self.cells[metric], values):
+                cell.config(text="—" if value is None else f"{value:.2f}")
 
 # Класс для приложения
 class SystemMonitorApp:
-    def __init__(self, root):
+    def __init__(self, root, sampler=None, db_name=DB_NAME):
         self.root = root
         self.root.title("Уровень загруженности:")
 
-        self.recording = False
+        self.db_name = db_name
         self.start_time = None
+        self.history_window = None
+        self.diagnostics_window = None
+        self.diagnostics_task = None
         self.data_queue = Queue()
+        # Последние TREND_MINUTES минут снимков для графиков, без обращений к базе.
+        # Графики получают одну точку за обновление окна, то есть каждый chart_stride-й снимок
+        self.trend = RingBuffer(max(int(TREND_MINUTES * 60 / SAMPLE_INTERVAL), 2))
+        self.chart_stride = max(round(UPDATE_INTERVAL / SAMPLE_INTERVAL), 1)
+        self.ui_scheduler = DeadlineScheduler(UPDATE_INTERVAL)
+
+        # Общий поток опроса: его снимки получают и метки, и запись
+        self.own_sampler = sampler is None
+        self.sampler = sampler or Sampler()
+        self.sampler.subscribe(self.data_queue.put)
+        # Оповещения проверяются в своем потоке и передаются окну через очередь
+        self.alert_queue = Queue()
+        self.active_alerts = {}
+        self.alerts = AlertEngine(default_rules())
+        self.alerts.subscribe(self.alert_queue.put)
+        self.sampler.subscribe(self.alerts.put)
+        self.alerts.start()
+        self.recorder = Recorder(self.sampler, db_name, alerts=self.alerts)
+        if self.own_sampler:
+            self.sampler.start()
 
         # Создание интерфейса
         self.create_widgets()
         self.update_task = self.root.after(0, self.update_data)
 
     def create_widgets(self):
+        capacity = max(self.trend.capacity // self.chart_stride, 2)
+
         self.cpu_label = tk.Label(self.root, text="ЦП: 0.00%")
         self.cpu_label.pack()
+        self.cpu_chart = SparklineChart(
+            self.root, capacity, lambda: downsample(self.trend.column("cpu_usage"), self.chart_stride)
+        )
+        self.cpu_chart.canvas.pack(fill=tk.X)
 
         self.memory_label = tk.Label(self.root, text="ОЗУ: 0.00ГБ / 0.00ГБ")
         self.memory_label.pack()
+        self.memory_chart = SparklineChart(
+            self.root, capacity, lambda: self.trend_used_percent("memory_available", "memory_total"), color="#3a9a4a"
+        )
+        self.memory_chart.canvas.pack(fill=tk.X)
 
         self.disk_label = tk.Label(self.root, text="ПЗУ: 0.00ГБ / 0.00ГБ")
         self.disk_label.pack()
+        self.disk_chart = SparklineChart(
+            self.root, capacity, lambda: self.trend_used_percent("disk_free", "disk_total"), color="#b0602a"
+        )
+        self.disk_chart.canvas.pack(fill=tk.X)
 
         self.start_button = tk.Button(self.root, text="Начать запись", command=self.start_recording)
         self.start_button.pack()
@@ -76,128 +346,369 @@ class SystemMonitorApp:
         self.history_button = tk.Button(self.root, text="История", command=self.show_history)
         self.history_button.pack()
 
+        self.diagnostics_button = tk.Button(self.root, text="Диагностика", command=self.show_diagnostics)
+        self.diagnostics_button.pack()
+
+        self.missed_label = tk.Label(self.root, text="")
+        self.missed_label.pack()
+
+        self.alert_label = tk.Label(self.root, text="", fg="red", justify=tk.LEFT)
+        self.alert_label.pack()
+
     def update_data(self):
-        cpu_usage, memory_usage, disk_usage = get_system_data()
-        self.cpu_label.config(text=f"ЦП: {cpu_usage:.2f}%")
+        timing = diagnostics.enabled
+        if timing:
+            started = time.perf_counter()
+            if self.ui_scheduler.deadline is not None:
+                # Насколько позже плановой границы такта сработал after
+                diagnostics.record("ui_lag", time.monotonic() - self.ui_scheduler.deadline)
+            diagnostics.gauge("ui_queue", self.data_queue.qsize())
+        sample = None
+        while not self.data_queue.empty():
+            sample = self.data_queue.get()
+            self.trend.append(sample)
+        if sample is not None:
+            self.show_sample(sample)
+            self.add_chart_sample(sample)
+        self.update_timer()
+        self.update_missed()
+        self.update_alerts()
+        if timing:
+            diagnostics.record("ui_update", time.perf_counter() - started)
+        # Задержка считается от сетки тактов, а не от окончания работы
+        self.update_task = self.root.after(int(self.ui_scheduler.advance() * 1000), self.update_data)
+
+    def show_sample(self, sample):
+        self.cpu_label.config(text=f"ЦП: {sample.cpu_usage:.2f}%")
         self.memory_label.config(
-            text=f"ОЗУ: {memory_usage.available / 1024 / 1024 / 1024:.2f}ГБ / {memory_usage.total / 1024 / 1024 / 1024:.2f}ГБ"
+            text=f"ОЗУ: {sample.memory_available / 1024 / 1024 / 1024:.2f}ГБ / {sample.memory_total / 1024 / 1024 / 1024:.2f}ГБ"
         )
         self.disk_label.config(
-            text=f"ПЗУ: {disk_usage.free / 1024 / 1024 / 1024:.2f}ГБ / {disk_usage.total / 1024 / 1024 / 1024:.2f}ГБ"
+            text=f"ПЗУ: {sample.disk_free / 1024 / 1024 / 1024:.2f}ГБ / {sample.disk_total / 1024 / 1024 / 1024:.2f}ГБ"
         )
-        self.update_task = self.root.after(int(UPDATE_INTERVAL * 1000), self.update_data)
+
+    def add_chart_sample(self, sample):
+        self.cpu_chart.push(sample.cpu_usage)
+        self.memory_chart.push(used_percent(sample.memory_available, sample.memory_total))
+        self.disk_chart.push(used_percent(sample.disk_free, sample.disk_total))
+
+    def trend_used_percent(self, available_field, total_field):
+        available = downsample(self.trend.column(available_field), self.chart_stride)
+        total = downsample(self.trend.column(total_field), self.chart_stride)
+        return [used_percent(a, t) for a, t in zip(available, total)]
+
+    def update_missed(self):
+        scheduler = self.sampler.scheduler
+        if scheduler.missed:
+            self.missed_label.config(
+                text=f"Пропущено тактов: {scheduler.missed}, интервал опроса {scheduler.interval:g} с"
+            )
+
+    # Список сработавших и еще не снятых оповещений
+    def update_alerts(self):
+        changed = False
+        while not self.alert_queue.empty():
+            alert = self.alert_queue.get()
+            changed = True
+            if alert.state == "raised":
+                self.active_alerts[alert.rule.name] = alert
+                self.root.bell()
+            else:
+                self.active_alerts.pop(alert.rule.name, None)
+        if changed:
+            self.alert_label.config(text="\n".join(
+                f"{time.strftime('%H:%M:%S', time.localtime(alert.timestamp / 1000))} {name}: {alert.value:.2f}"
+                for name, alert in self.active_alerts.items()
+            ))
 
     def stop_update(self):
         if self.update_task:
             self.root.after_cancel(self.update_task)
             self.update_task = None
 
+    @property
+    def recording(self):
+        return self.recorder.recording
+
     def start_recording(self):
         if not self.recording:
-            self.recording = True
             self.start_time = time.time()
             self.timer_label.config(text="00:00:00")
             self.timer_label.pack()
             self.start_button.pack_forget()
             self.stop_button.pack()
-            self.record_thread = threading.Thread(target=self.record_data, daemon=True)
-            self.record_thread.start()
+            self.recorder.start()
         else:
             messagebox.showinfo("Запись уже идет", "Запись уже идет!")
 
     def stop_recording(self):
         if self.recording:
-            self.recording = False
+            self.recorder.stop()
             self.stop_button.pack_forget()
             self.start_button.pack()
             self.timer_label.pack_forget()
             self.timer_label.config(text="00:00:00")
             self.start_time = None
 
-    def record_data(self):
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            while self.recording:
-                #timestamp = time.time()
-                timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-                cpu_usage, memory_usage, disk_usage = get_system_data()
-
-                memory_available = round(memory_usage.available / 1024 / 1024 / 1024, 2)
-                memory_total = round(memory_usage.total / 1024 / 1024 / 1024, 2)
-                disk_free = round(disk_usage.free / 1024 / 1024 / 1024, 2)
-                disk_total = round(disk_usage.total / 1024 / 1024 / 1024, 2)
-
-                try:
-                    cursor.execute(
-                        "INSERT INTO system_data (timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total) VALUES (?, ?, ?, ?, ?, ?)",
-                        (timestamp, cpu_usage, memory_available, memory_total, disk_free, disk_total),
-                    )
-                    conn.commit()
-                except sqlite3.Error as e:
-                    print(f"Ошибка записи в базу данных: {e}")
-
-                elapsed_time = time.time() - self.start_time
-                minutes, seconds = divmod(int(elapsed_time), 60)
-                hours, minutes = divmod(minutes, 60)
-                self.data_queue.put(f"{hours:02}:{minutes:02}:{seconds:02}")
-                self.root.after(0, self.update_timer)
-                time.sleep(UPDATE_INTERVAL)
-
     def update_timer(self):
-        while not self.data_queue.empty():
-            self.timer_label.config(text=self.data_queue.get())
+        if self.start_time is None:
+            return
+        elapsed_time = time.time() - self.start_time
+        minutes, seconds = divmod(int(elapsed_time), 60)
+        hours, minutes = divmod(minutes, 60)
+        self.timer_label.config(text=f"{hours:02}:{minutes:02}:{seconds:02}")
+
+    def on_close(self):
+        self.stop_recording()
+        self.stop_update()
+        self.sampler.unsubscribe(self.data_queue.put)
+        self.sampler.unsubscribe(self.alerts.put)
+        self.alerts.stop()
+        if self.own_sampler:
+            self.sampler.stop()
+        self.root.destroy()
 
     def show_history(self):
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM system_data")
-            data = cursor.fetchall()
+        # Окно истории одно: его элементы и соединение хранятся в самом
+        # приложении, поэтому повторное нажатие поднимает уже открытое окно
+        if self.history_window is not None and self.history_window.winfo_exists():
+            self.history_window.lift()
+            self.history_window.focus_set()
+            return
 
-            # Логирование данных из базы
-            print(f"Полученные данные из базы данных: {data}")
+        conn = sqlite3.connect(self.db_name)
+        start = first_timestamp(conn)
 
-            if not data:
-                messagebox.showinfo("История", "Нет данных для отображения.")
-                return
+        if start is None:
+            conn.close()
+            messagebox.showinfo("История", "Нет данных для отображения.")
+            return
 
         self.history_window = tk.Toplevel(self.root)
         self.history_window.title("История записи")
 
-        self.tree = Treeview(
-            self.history_window,
-            columns=("id", "timestamp", "cpu_usage", "memory_available", "memory_total", "disk_free", "disk_total"),
-            show="headings",
+        controls = tk.Frame(self.history_window)
+        controls.pack(fill=tk.X)
+        self.range_box = Combobox(controls, values=[name for name, _ in HISTORY_RANGES], state="readonly")
+        self.range_box.current(len(HISTORY_RANGES) - 1)
+        self.range_box.pack(side=tk.LEFT)
+        self.range_box.bind("<<ComboboxSelected>>", lambda event: self.load_history_range(conn, start))
+        self.resolution_label = tk.Label(controls)
+        self.resolution_label.pack(side=tk.LEFT)
+        self.export_button = tk.Button(controls, text="Экспорт", command=self.export_history)
+        self.export_button.pack(side=tk.RIGHT)
+
+        # Произвольный диапазон: границы в местном времени, пустая — без границы
+        period = tk.Frame(self.history_window)
+        period.pack(fill=tk.X)
+        tk.Label(period, text="С").pack(side=tk.LEFT)
+        self.from_entry = tk.Entry(period, width=20)
+        self.from_entry.pack(side=tk.LEFT)
+        tk.Label(period, text="по").pack(side=tk.LEFT)
+        self.to_entry = tk.Entry(period, width=20)
+        self.to_entry.pack(side=tk.LEFT)
+        tk.Button(period, text="Применить", command=lambda: self.apply_history_period(conn)).pack(side=tk.LEFT)
+
+        self.stats_view = StatsView(self.history_window)
+        self.stats_view.frame.pack(fill=tk.X)
+        self.stats_request = 0
+
+        self.history_frame = tk.Frame(self.history_window)
+        self.history_frame.pack(fill=tk.BOTH, expand=True)
+        self.load_history_range(conn, start)
+
+        history_window = self.history_window
+        history_window.protocol("WM_DELETE_WINDOW", lambda: (conn.close(), history_window.destroy()))
+
+    # Заполнение таблицы истории для выбранного в списке диапазона
+    def load_history_range(self, conn, start):
+        _, seconds = HISTORY_RANGES[self.range_box.current()]
+        t0 = start if seconds is None else max(start, now_ms() - seconds * 1000)
+        self.from_entry.delete(0, tk.END)
+        self.from_entry.insert(0, format_time(t0))
+        self.to_entry.delete(0, tk.END)
+        self.load_history(conn, t0)
+
+    def apply_history_period(self, conn):
+        texts = self.from_entry.get().strip(), self.to_entry.get().strip()
+        try:
+            t0, t1 = [parse_time(text) if text else None for text in texts]
+        except ValueError as e:
+            messagebox.showerror("История", str(e), parent=self.history_window)
+            return
+        self.load_history(conn, t0 or first_timestamp(conn), t1)
+
+    # Таблица истории с подходящим разрешением и статистика за диапазон
+    def load_history(self, conn, t0, t1=None):
+        timing = diagnostics.enabled
+        if timing:
+            started = time.perf_counter()
+        table = pick_resolution(t0, t1)
+        rows = samples_between(conn, t0, t1, table=table, limit=HISTORY_PAGE_SIZE)
+
+        for child in self.history_frame.winfo_children():
+            child.destroy()
+        self.history = HistoryView(self.history_frame, conn, rows, t0, t1, table=table)
+        self.tree = self.history.tree
+        self.resolution_label.config(text=RESOLUTION_NAMES[table])
+        if timing:
+            diagnostics.record("history_render", time.perf_counter() - started)
+        self.update_stats(t0, t1)
+
+    # Статистика считается в фоновом потоке со своим соединением; результат
+    # устаревшего запроса, если диапазон успели сменить, отбрасывается
+    def update_stats(self, t0, t1=None):
+        self.stats_request += 1
+        request = self.stats_request
+        self.stats_view.clear("Расчет статистики...")
+
+        def done(result):
+            if request == self.stats_request and self.stats_view.frame.winfo_exists():
+                self.stats_view.show(*result)
+
+        self.run_in_background(lambda: self.calculate_stats(t0, t1), done)
+
+    def calculate_stats(self, t0, t1):
+        # Самая подробная таблица, в которой диапазон еще хранится; по базе
+        # уточняется, не слишком ли в ней много строк
+        table = pick_resolution(t0, t1, max_points=STATS_MAX_POINTS)
+        try:
+            conn = sqlite3.connect(self.db_name)
+            try:
+                table = stats_resolution(conn, t0, t1)
+                return (table, *range_stats(conn, t0, t1, table))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            return table, 0, f"Ошибка расчета статистики: {e}"
+
+    # Выгрузка выбранного диапазона истории в фоновом потоке
+    def export_history(self):
+        path = filedialog.asksaveasfilename(
+            parent=self.history_window,
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")],
         )
-
-        self.tree.heading("id", text="ID")
-        self.tree.heading("timestamp", text="Время записи")
-        self.tree.heading("cpu_usage", text="ЦП")
-        self.tree.heading("memory_available", text="ОЗУ (свободное)")
-        self.tree.heading("memory_total", text="ОЗУ (всего)")
-        self.tree.heading("disk_free", text="ПЗУ (свободное)")
-        self.tree.heading("disk_total", text="ПЗУ (всего)")
-
-        # Вставка данных в Treeview
-        for row in data:
-            formatted_row = (
-                row[0],
-                row[1],
-                f"{row[2]:.2f}",
-                f"{row[3]:.2f}",
-                f"{row[4]:.2f}",
-                f"{row[5]:.2f}",
-                f"{row[6]:.2f}",
-            )
-            self.tree.insert("", tk.END, values=formatted_row)
-
-        self.tree.pack()
-
-
-# Создание базы данных
-create_db()
-
-# Запуск приложения
-root = tk.Tk()
-app = SystemMonitorApp(root)
-root.protocol("WM_DELETE_WINDOW", lambda: (app.stop_update(), root.destroy()))
-root.mainloop()
+        if not path:
+            return
+        t0, t1, table = self.history.t0, self.history.t1, self.history.table
+        self.export_button.config(state=tk.DISABLED)
+        self.run_in_background(lambda: self.run_export(path, t0, t1, table), self.export_done)
+
+    def run_export(self, path, t0, t1, table):
+        try:
+            return f"Выгружено записей: {export_file(self.db_name, path, t0, t1, table)}"
+        except (OSError, ValueError, sqlite3.Error) as e:
+            return f"Ошибка экспорта: {e}"
+
+    def export_done(self, message):
+        if self.export_button.winfo_exists():
+            self.export_button.config(state=tk.NORMAL)
+        messagebox.showinfo("Экспорт", message)
+
+    # Окно самодиагностики: задержки по операциям, глубина очередей и
+    # потребление процесса, обновляемые раз в DIAGNOSTICS_REFRESH мс
+    def show_diagnostics(self):
+        if self.diagnostics_window is not None and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift()
+            self.diagnostics_window.focus_set()
+            return
+
+        self.diagnostics_window = tk.Toplevel(self.root)
+        self.diagnostics_window.title("Самодиагностика")
+        self.diagnostics_window.protocol("WM_DELETE_WINDOW", self.close_diagnostics)
+
+        controls = tk.Frame(self.diagnostics_window)
+        controls.pack(fill=tk.X)
+        self.diagnostics_enabled = tk.BooleanVar(self.diagnostics_window, value=diagnostics.enabled)
+        tk.Checkbutton(
+            controls, text="Включена", variable=self.diagnostics_enabled, command=self.toggle_diagnostics
+        ).pack(side=tk.LEFT)
+        tk.Button(controls, text="Сохранить JSON", command=self.save_diagnostics).pack(side=tk.RIGHT)
+
+        self.diagnostics_tree = Treeview(self.diagnostics_window, columns=DIAGNOSTICS_COLUMNS)
+        self.diagnostics_tree.heading("#0", text="Операция")
+        for column, text in zip(DIAGNOSTICS_COLUMNS, ("Число", "Среднее, мс", "p50, мс", "p95, мс", "p99, мс", "Макс, мс")):
+            self.diagnostics_tree.heading(column, text=text)
+            self.diagnostics_tree.column(column, width=90, anchor=tk.E)
+        self.diagnostics_tree.pack(fill=tk.BOTH, expand=True)
+
+        self.diagnostics_label = tk.Label(self.diagnostics_window, justify=tk.LEFT, anchor="w")
+        self.diagnostics_label.pack(fill=tk.X)
+        self.refresh_diagnostics()
+
+    def toggle_diagnostics(self):
+        if self.diagnostics_enabled.get():
+            diagnostics.enable()
+        else:
+            diagnostics.disable()
+
+    def close_diagnostics(self):
+        if self.diagnostics_task:
+            self.root.after_cancel(self.diagnostics_task)
+            self.diagnostics_task = None
+        self.diagnostics_window.destroy()
+
+    def refresh_diagnostics(self):
+        # Внеочередное обновление заменяет запланированное, цикл обновления остается один
+        if self.diagnostics_task:
+            self.root.after_cancel(self.diagnostics_task)
+            self.diagnostics_task = None
+        if not self.diagnostics_window.winfo_exists():
+            return
+        snapshot = diagnostics.snapshot()
+        self.diagnostics_tree.delete(*self.diagnostics_tree.get_children())
+        for name, summary in snapshot["latency"].items():
+            values = [summary["count"]] + [f"{summary[column]:.3f}" for column in DIAGNOSTICS_COLUMNS[1:]]
+            self.diagnostics_tree.insert("", tk.END, text=name, values=values)
+        process = snapshot["process"]
+        lines = [
+            f"Процесс: ЦП {process['cpu_percent']:.1f}%, RSS {process['rss'] / 1024 ** 2:.1f} МБ, "
+            f"потоков {process['threads']}"
+        ]
+        lines += [f"{name}: {gauge['value']} (макс. {gauge['max']})" for name, gauge in snapshot["gauges"].items()]
+        if not snapshot["enabled"]:
+            lines.append("Замеры выключены")
+        self.diagnostics_label.config(text="\n".join(lines))
+        self.diagnostics_task = self.root.after(DIAGNOSTICS_REFRESH, self.refresh_diagnostics)
+
+    def save_diagnostics(self):
+        path = filedialog.asksaveasfilename(
+            parent=self.diagnostics_window, defaultextension=".json", filetypes=[("JSON", "*.json")]
+        )
+        if not path:
+            return
+        try:
+            diagnostics.dump(path)
+        except OSError as e:
+            messagebox.showerror("Самодиагностика", f"Ошибка сохранения: {e}", parent=self.diagnostics_window)
+
+    # Выполнение work() в отдельном потоке, чтобы окно не блокировалось.
+    # Завершение проверяется опросом через after, и done(результат)
+    # вызывается уже в потоке интерфейса
+    def run_in_background(self, work, done):
+        result = []
+        worker = threading.Thread(target=lambda: result.append(work()), daemon=True)
+        worker.start()
+        self.root.after(100, self.check_background, worker, result, done)
+
+    def check_background(self, worker, result, done):
+        if worker.is_alive():
+            self.root.after(100, self.check_background, worker, result, done)
+        elif result:
+            done(result[0])
+
+
+def main():
+    # Создание базы данных
+    create_db()
+
+    # Запуск приложения
+    root = tk.Tk()
+    app = SystemMonitorApp(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_close)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()